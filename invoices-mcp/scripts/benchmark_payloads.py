@@ -0,0 +1,98 @@
+"""
+Measure the size and serialisation time of transaction list payloads in the
+'rows' and 'columns' shapes, raw and as sent with gzip or zstd compression.
+
+    python scripts/benchmark_payloads.py [--rows 100 1000 10000] [--repeats 5]
+"""
+
+import argparse
+import datetime
+import gzip
+import random
+import statistics
+import sys
+import time
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from compression import zstandard  # noqa: E402
+from server import transaction_list_result  # noqa: E402
+
+CATEGORIES = ["Software", "Travel", "Office", "Marketing", None]
+COUNTERPARTIES = ["Fly.io", "Google Cloud", "Deutsche Bahn", "Notion Labs", "Figma"]
+
+
+def synthetic_rows(count: int) -> list[dict]:
+    """Rows shaped like `select(*transaction_columns())` results."""
+    rng = random.Random(count)
+    start = datetime.date(2024, 1, 1)
+    rows = []
+    for i in range(count):
+        date = start + datetime.timedelta(days=rng.randrange(730))
+        counterparty = rng.choice(COUNTERPARTIES)
+        rows.append(
+            {
+                "transaction_id": f"txn_{i:08d}",
+                "date": date,
+                "amount": Decimal(rng.randrange(-500000, 500000)) / 100,
+                "description": f"{counterparty} invoice {rng.randrange(10**6)}",
+                "reference": f"RF{rng.randrange(10**10):010d}",
+                "category": rng.choice(CATEGORIES),
+                "currency": "EUR",
+                "counterparty": counterparty,
+                "provider": rng.choice(["bank", "stripe"]),
+                "transaction_type": rng.choice(["expense", "income"]),
+                "month_year": date.strftime("%Y-%m"),
+                "is_stripe_invoice": rng.random() < 0.1,
+                "is_invalid": False,
+                "created_at": datetime.datetime(2025, 1, 1, 10, 0, 0),
+                "invoice_number": None,
+                "invoice_file_path": None,
+            }
+        )
+    return rows
+
+
+def measure(rows: list[dict], shape: str, repeats: int) -> dict:
+    """Median time to build the tool result, and the size of its text content."""
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = transaction_list_result(rows, shape)
+        seconds.append(time.perf_counter() - start)
+    body = result.content[0].text.encode()
+    sizes = {"raw": len(body), "gzip": len(gzip.compress(body, compresslevel=6))}
+    if zstandard:
+        sizes["zstd"] = len(zstandard.ZstdCompressor(level=3).compress(body))
+    return {"ms": statistics.median(seconds) * 1000, **sizes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    encodings = ["raw", "gzip"] + (["zstd"] if zstandard else [])
+    print(
+        f"{'rows':>7} {'shape':>8} {'serialise':>10} "
+        + " ".join(f"{encoding:>10}" for encoding in encodings)
+    )
+    for count in args.rows:
+        rows = synthetic_rows(count)
+        for shape in ("rows", "columns"):
+            result = measure(rows, shape, args.repeats)
+            print(
+                f"{count:>7} {shape:>8} {result['ms']:>8.1f}ms "
+                + " ".join(
+                    f"{result[encoding] / 1024:>8.1f}KB" for encoding in encodings
+                )
+            )
+    if not zstandard:
+        print("\nzstd: not measured, install invoices-mcp[zstd]")
+
+
+if __name__ == "__main__":
+    main()
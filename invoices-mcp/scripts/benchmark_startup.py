@@ -0,0 +1,98 @@
+"""
+Measure how long the MCP server module takes to import and how much memory it
+uses, and check that the browser agent and OCR SDKs are not loaded at startup.
+
+    python scripts/benchmark_startup.py [--repeats 5]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+
+# Only needed once an invoice is retrieved
+LAZY_MODULES = ["browser_use", "mistralai", "openai", "langchain_core"]
+
+PROBE = f"""
+import json, resource, sys, time
+start = time.perf_counter()
+import server
+elapsed = time.perf_counter() - start
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform != "darwin":
+    rss *= 1024  # kilobytes on Linux, bytes on macOS
+print(json.dumps({{
+    "seconds": elapsed,
+    "max_rss_mb": rss / 1024 / 1024,
+    "loaded": [name for name in {LAZY_MODULES!r} if name in sys.modules],
+}}))
+"""
+
+
+def probe() -> dict:
+    # A fresh interpreter per run, so nothing is already imported or cached in memory
+    result = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", PROBE],
+        cwd=SRC_DIR,
+        env={**os.environ, "PYTHONPATH": str(SRC_DIR)},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(limit: int = 10) -> list[tuple[int, str]]:
+    """Cumulative import time (µs) of the slowest top-level imports of server."""
+    result = subprocess.run(
+        [sys.executable, "-W", "ignore", "-X", "importtime", "-c", "import server"],
+        cwd=SRC_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        # Two spaces of indentation are direct imports of the server module
+        if (
+            cumulative.strip().isdigit()
+            and name.startswith("   ")
+            and not name.startswith("    ")
+        ):
+            imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    probe()  # warm up the bytecode cache
+    runs = [probe() for _ in range(args.repeats)]
+    seconds = [run["seconds"] for run in runs]
+    print(
+        f"import server: median {statistics.median(seconds) * 1000:.0f} ms, "
+        f"min {min(seconds) * 1000:.0f} ms over {args.repeats} runs"
+    )
+    print(f"max RSS: {statistics.median(run['max_rss_mb'] for run in runs):.0f} MB")
+
+    print("\nslowest imports:")
+    for cumulative, name in slowest_imports():
+        print(f"  {cumulative / 1000:8.0f} ms  {name}")
+
+    if loaded := runs[-1]["loaded"]:
+        print(f"\nloaded at startup but only needed for invoices: {', '.join(loaded)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,492 @@
+"""
+Load-test the MCP server over HTTP and report latency percentiles and throughput per tool.
+
+Runs against local Postgres or SQLite seeded with synthetic transactions.
+
+The server runs in a subprocess with the browser agent, the browser pool and
+the Mistral OCR client replaced by stubs that only wait, so invoice requests
+exercise the server's own path (limits, caches, PDF handling) without a
+browser or API keys.
+
+    python scripts/load_test.py                         # temporary SQLite database
+    python scripts/load_test.py --database-url postgresql://localhost/invoices --seed 50000
+    python scripts/load_test.py --rate get_transactions=50 --rate find_and_download_invoice=2 --duration 60
+
+Requests are sent open-loop at the given rates: each is sent at its scheduled
+time whether or not earlier ones have finished, and its latency is measured
+from that time, so a server falling behind shows up as growing latency instead
+of a lower request rate.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import types
+import urllib.request
+from collections import defaultdict
+from decimal import Decimal
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+DEFAULT_RATES = {
+    "get_transactions": 8.0,
+    "get_transaction_summary": 2.0,
+    "find_and_download_invoice": 0.5,
+}
+# Per-domain agent limits apply, so invoice requests are spread over several
+INVOICE_DOMAINS = [f"vendor-{i}.example.com" for i in range(8)]
+CATEGORIES = ["Software", "Travel", "Office", "Marketing", None]
+COUNTERPARTIES = ["Fly.io", "Google Cloud", "Deutsche Bahn", "Notion Labs", "Figma"]
+# Seeded rows use this ID prefix, so seeding a real database only replaces them
+SEED_PREFIX = "loadtest-"
+
+
+def synthetic_transactions(count: int) -> list[dict]:
+    rng = random.Random(0)
+    start = datetime.date.today() - datetime.timedelta(days=730)
+    rows = []
+    for i in range(count):
+        date = start + datetime.timedelta(days=rng.randrange(730))
+        counterparty = rng.choice(COUNTERPARTIES)
+        expense = rng.random() < 0.8
+        rows.append(
+            {
+                "transaction_id": f"{SEED_PREFIX}{i:08d}",
+                "date": date,
+                "amount": Decimal(rng.randrange(100, 500000))
+                / 100
+                * (-1 if expense else 1),
+                "description": f"{counterparty} invoice {rng.randrange(10**6)}",
+                "reference": f"RF{rng.randrange(10**10):010d}",
+                "category": rng.choice(CATEGORIES),
+                "currency": "EUR",
+                "counterparty": counterparty,
+                "provider": rng.choice(["bank", "stripe"]),
+                "transaction_type": "expense" if expense else "income",
+                "month_year": date.strftime("%Y-%m"),
+                "is_stripe_invoice": rng.random() < 0.1,
+                "is_invalid": rng.random() < 0.02,
+                "created_at": datetime.datetime.now(),
+            }
+        )
+    return rows
+
+
+def attach_sqlite_schema(engine) -> None:
+    """Serve the ivy_data schema from the SQLite database file itself."""
+    from sqlalchemy import event
+
+    path = engine.url.database
+
+    @event.listens_for(engine, "connect")
+    def attach(connection, record):
+        connection.execute(f"ATTACH DATABASE '{path}' AS ivy_data")
+
+
+def database_manager(database_url: str):
+    from models import DatabaseManager
+
+    manager = DatabaseManager(database_url)
+    if manager.engine.dialect.name == "sqlite":
+        attach_sqlite_schema(manager.engine)
+    return manager
+
+
+def seed_database(database_url: str, count: int) -> None:
+    """Replace the synthetic transactions and rebuild the daily rollup."""
+    from models import Base, Transaction
+    from rollup import refresh_daily_rollup
+    from sqlalchemy import delete, insert, text
+
+    manager = database_manager(database_url)
+    with manager.engine.begin() as connection:
+        if manager.engine.dialect.name != "sqlite":
+            connection.execute(text("CREATE SCHEMA IF NOT EXISTS ivy_data"))
+    Base.metadata.create_all(manager.engine)
+
+    session = manager.get_session()
+    try:
+        session.execute(
+            delete(Transaction).where(
+                Transaction.transaction_id.startswith(SEED_PREFIX)
+            )
+        )
+        rows = synthetic_transactions(count)
+        for start in range(0, len(rows), 5000):
+            session.execute(insert(Transaction), rows[start : start + 5000])
+        refresh_daily_rollup(session)
+        session.commit()
+    finally:
+        session.close()
+    manager.engine.dispose()
+
+
+def serve(args) -> None:
+    """Run the MCP server with the invoice retrieval stubbed out."""
+    import server
+    from agent import AgentRun, AgentRunStats
+
+    server.db_manager = database_manager(args.database_url)
+
+    class StubBrowserPool:
+        """Leases no browser; the stub agent does not need one."""
+
+        max_size = server.MAX_CONCURRENT_AGENTS
+        leased = idle = 0
+        min_idle = 0
+
+        @contextlib.asynccontextmanager
+        async def lease(self, downloads_path=None):
+            yield None
+
+        async def warm(self):
+            pass
+
+        async def close(self):
+            pass
+
+    class StubHistory:
+        def urls(self):
+            return []
+
+        def final_result(self):
+            return None
+
+    async def create_agent(*, tx_reference, **kwargs):
+        return types.SimpleNamespace(reference=tx_reference)
+
+    async def run_agent(agent, *, downloads_path, **kwargs):
+        await asyncio.sleep(args.agent_delay)
+        # A PDF without a text layer, unique per transaction so the OCR cache
+        # misses and local extraction hands over to (stubbed) OCR
+        path = downloads_path / "invoice.pdf"
+        path.write_bytes(f"%PDF-1.4\n% {agent.reference}\n%%EOF\n".encode())
+        return AgentRun(
+            history=StubHistory(),
+            downloaded_file_path=str(path),
+            stats=AgentRunStats(
+                steps=1,
+                tokens=0,
+                elapsed_seconds=args.agent_delay,
+                stop_reason="download",
+            ),
+        )
+
+    class StubMistral:
+        def __init__(self):
+            self.files = types.SimpleNamespace(
+                upload_async=self.upload_async,
+                get_signed_url_async=self.get_signed_url_async,
+                delete_async=self.delete_async,
+            )
+            self.ocr = types.SimpleNamespace(process_async=self.process_async)
+
+        async def upload_async(self, *, file, purpose):
+            file["content"].read()
+            return types.SimpleNamespace(id="stub")
+
+        async def get_signed_url_async(self, *, file_id):
+            return types.SimpleNamespace(url=f"https://example.com/{file_id}")
+
+        async def delete_async(self, *, file_id):
+            pass
+
+        async def process_async(self, **kwargs):
+            await asyncio.sleep(args.ocr_delay)
+            return types.SimpleNamespace(
+                document_annotation=json.dumps(
+                    {
+                        "invoice_date": datetime.date.today().isoformat(),
+                        "invoice_amount": 42.0,
+                        "invoice_number": "INV-0001",
+                        "invoice_currency": "EUR",
+                    }
+                )
+            )
+
+    stub_mistral = StubMistral()
+    server.browser_pool = StubBrowserPool()
+    server.create_agent = create_agent
+    server.run_agent = run_agent
+    server.mistral_client = lambda: stub_mistral
+
+    asyncio.run(server.main())
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args, workdir: Path, port: int) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "MCP_PORT": str(port),
+        "MCP_WORKERS": "1",
+        "DATABASE_URL": args.database_url,
+        # Fresh caches, so invoice requests run the (stubbed) agent and OCR
+        "INVOICES_MCP_CACHE_DIR": str(workdir / "cache"),
+        "INVOICE_DOWNLOADS_DIR": str(workdir / "downloads"),
+        "BROWSER_POOL_MIN_IDLE": "0",
+        "FASTMCP_LOG_LEVEL": "WARNING",
+    }
+    command = [
+        sys.executable,
+        __file__,
+        "--serve",
+        f"--database-url={args.database_url}",
+        f"--agent-delay={args.agent_delay}",
+        f"--ocr-delay={args.ocr_delay}",
+    ]
+    with open(workdir / "server.log", "w") as log:
+        process = subprocess.Popen(
+            command, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited:\n{server_log(workdir)}")
+        with contextlib.suppress(OSError):
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=1)
+            return process
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"Server did not start:\n{server_log(workdir)}")
+
+
+def server_log(workdir: Path) -> str:
+    # The work directory is removed on exit, so failures quote the log
+    return (workdir / "server.log").read_text()[-3000:]
+
+
+def tool_arguments(tool: str, n: int, args) -> dict:
+    if tool == "get_transactions":
+        return {"limit": args.page_size}
+    if tool == "find_and_download_invoice":
+        return {
+            "domainOrUrl": INVOICE_DOMAINS[n % len(INVOICE_DOMAINS)],
+            "date": datetime.date.today().isoformat(),
+            # Unique per request, so the invoice cache never answers it
+            "reference": f"load-{os.getpid()}-{n}",
+            "amount": 42.0,
+        }
+    return {}
+
+
+async def call_tool(client, tool: str, arguments: dict) -> None:
+    """tools/call through the client's MCP session, without the check of the
+    result against the tool's output schema: for a page of transactions that
+    check costs the load generator more CPU than the server spends on the call."""
+    from mcp import types as mcp_types
+
+    result = await client.session.send_request(
+        mcp_types.ClientRequest(
+            mcp_types.CallToolRequest(
+                params=mcp_types.CallToolRequestParams(name=tool, arguments=arguments)
+            )
+        ),
+        mcp_types.CallToolResult,
+    )
+    if result.isError:
+        raise RuntimeError(result.content[0].text if result.content else "Tool error")
+
+
+async def generate_load(url: str, rates: dict[str, float], args) -> dict:
+    from fastmcp import Client
+
+    latencies = defaultdict(list)
+    errors = defaultdict(list)
+
+    async with contextlib.AsyncExitStack() as stack:
+        clients = [
+            await stack.enter_async_context(Client(url, timeout=args.timeout))
+            for _ in range(args.connections)
+        ]
+
+        async def request(tool: str, n: int, scheduled: float):
+            client = clients[n % len(clients)]
+            try:
+                await call_tool(client, tool, tool_arguments(tool, n, args))
+            except Exception as e:
+                errors[tool].append(str(e))
+            else:
+                latencies[tool].append(time.perf_counter() - scheduled)
+
+        async def schedule(tool: str, rate: float, tasks: list):
+            interval = 1 / rate
+            n = 0
+            while (scheduled := start + n * interval) < start + args.duration:
+                await asyncio.sleep(max(0, scheduled - time.perf_counter()))
+                tasks.append(asyncio.create_task(request(tool, n, scheduled)))
+                n += 1
+
+        tasks: list[asyncio.Task] = []
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(schedule(tool, rate, tasks) for tool, rate in rates.items() if rate > 0)
+        )
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    return {"elapsed": elapsed, "latencies": latencies, "errors": errors}
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    rank = max(1, round(p / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarise(results: dict, rates: dict[str, float]) -> dict:
+    summary = {}
+    everything = []
+    for tool, rate in rates.items():
+        values = sorted(results["latencies"][tool])
+        everything += values
+        summary[tool] = tool_summary(
+            values, results["errors"][tool], results["elapsed"], rate
+        )
+    errors = [e for tool_errors in results["errors"].values() for e in tool_errors]
+    summary["total"] = tool_summary(
+        sorted(everything), errors, results["elapsed"], sum(rates.values())
+    )
+    return summary
+
+
+def tool_summary(values, errors, elapsed, rate) -> dict:
+    summary = {
+        "target_rps": rate,
+        "ok": len(values),
+        "errors": len(errors),
+        "throughput_rps": len(values) / elapsed,
+    }
+    if values:
+        summary.update(
+            {f"p{p}_ms": percentile(values, p) * 1000 for p in (50, 95, 99)},
+            max_ms=values[-1] * 1000,
+        )
+    if errors:
+        summary["first_error"] = errors[0]
+    return summary
+
+
+def print_report(summary: dict, elapsed: float) -> None:
+    print(f"\n{elapsed:.1f}s of load\n")
+    print(
+        f"{'tool':<28} {'target/s':>8} {'done/s':>8} {'ok':>6} {'errors':>6} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}"
+    )
+    for tool, row in summary.items():
+        latencies = " ".join(
+            f"{row[key]:>8.1f}" if key in row else f"{'-':>8}"
+            for key in ("p50_ms", "p95_ms", "p99_ms", "max_ms")
+        )
+        print(
+            f"{tool:<28} {row['target_rps']:>8.1f} {row['throughput_rps']:>8.1f} "
+            f"{row['ok']:>6} {row['errors']:>6} {latencies}"
+        )
+    for tool, row in summary.items():
+        if tool != "total" and "first_error" in row:
+            print(f"\n{tool}: {row['first_error']}")
+
+
+def parse_rate(value: str) -> tuple[str, float]:
+    tool, _, rate = value.partition("=")
+    if tool not in DEFAULT_RATES or not rate:
+        raise argparse.ArgumentTypeError(
+            f"expected TOOL=REQUESTS_PER_SECOND with TOOL one of {', '.join(DEFAULT_RATES)}"
+        )
+    return tool, float(rate)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--database-url",
+        help="Database to load-test against (default: a temporary SQLite file, seeded)",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        help=f"Insert this many synthetic transactions (IDs starting with {SEED_PREFIX!r}), replacing earlier ones",
+    )
+    parser.add_argument(
+        "--rate",
+        type=parse_rate,
+        action="append",
+        default=[],
+        metavar="TOOL=RPS",
+        help=f"Requests per second for a tool (default: {', '.join(f'{tool}={rate:g}' for tool, rate in DEFAULT_RATES.items())}); 0 leaves it out",
+    )
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of load")
+    parser.add_argument(
+        "--connections",
+        type=int,
+        default=4,
+        help="MCP client sessions to spread requests over",
+    )
+    parser.add_argument(
+        "--page-size", type=int, default=100, help="limit of get_transactions calls"
+    )
+    parser.add_argument(
+        "--agent-delay", type=float, default=0.5, help="Seconds the stub agent takes"
+    )
+    parser.add_argument(
+        "--ocr-delay", type=float, default=0.2, help="Seconds the stub OCR takes"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=120, help="Per-request timeout"
+    )
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    rates = {**DEFAULT_RATES, **dict(args.rate)}
+    with tempfile.TemporaryDirectory(prefix="invoices-mcp-load-") as workdir:
+        workdir = Path(workdir)
+        if not args.database_url:
+            args.database_url = f"sqlite:///{workdir / 'transactions.sqlite3'}"
+            args.seed = args.seed or 10000
+        if args.seed:
+            print(f"Seeding {args.seed} synthetic transactions...", file=sys.stderr)
+            seed_database(args.database_url, args.seed)
+
+        port = free_port()
+        server = start_server(args, workdir, port)
+        try:
+            print(f"Sending load for {args.duration:g}s...", file=sys.stderr)
+            results = asyncio.run(
+                generate_load(f"http://127.0.0.1:{port}/mcp/", rates, args)
+            )
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+    summary = summarise(
+        results, {tool: rate for tool, rate in rates.items() if rate > 0}
+    )
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_report(summary, results["elapsed"])
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,179 @@
 import argparse
 import asyncio
+import contextlib
 import datetime
+import functools
+import logging
+import os
+import statistics
+import sys
+import time
+from dataclasses import dataclass
 from pathlib import Path
+from typing import TYPE_CHECKING, Literal, Optional
+from urllib.parse import urlparse
 
-from browser_use import Agent, BrowserProfile, BrowserSession, Controller
-from browser_use.llm import ChatOpenAI
 from dotenv import load_dotenv
-from pydantic import BaseModel
+from downloads import DownloadWatcher
+from pydantic import BaseModel, Field
+
+# browser_use pulls in every LLM provider SDK it supports, which takes seconds;
+# it is imported on first use so query-only servers never load it
+if TYPE_CHECKING:
+    from browser_use import Agent, BrowserProfile, BrowserSession
+    from browser_use.agent.views import AgentHistoryList
+    from browser_use.llm import ChatOpenAI
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 
 class Result(BaseModel):
     downloaded_file_path: str
 
 
-llm = ChatOpenAI(model="gpt-4.1")
+class AgentRunStats(BaseModel):
+    steps: int = Field(description="Agent steps taken")
+    tokens: int = Field(description="LLM tokens used (prompt and completion)")
+    elapsed_seconds: float = Field(description="Wall-clock time of the agent run")
+    stop_reason: Literal["done", "download", "max_steps", "token_budget", "timeout"]
+
+
+@dataclass
+class AgentRun:
+    history: "AgentHistoryList"
+    # PDF saved by the browser during the run, if any
+    downloaded_file_path: Optional[str]
+    stats: AgentRunStats
+
+
+@functools.cache
+def agent_llm() -> "ChatOpenAI":
+    from browser_use.llm import ChatOpenAI
+
+    return ChatOpenAI(model="gpt-4.1")
+
+
+# "desktop" drives the local Chrome install with its logged-in profile (macOS);
+# "headless" runs a resource-blocking headless Chromium for Linux workers
+BROWSER_PROFILE = os.getenv(
+    "INVOICE_BROWSER_PROFILE", "desktop" if sys.platform == "darwin" else "headless"
+)
+BLOCK_RESOURCES = os.getenv("INVOICE_BROWSER_BLOCK_RESOURCES", "true") == "true"
+# Budgets for a single agent run
+AGENT_MAX_STEPS = int(os.getenv("INVOICE_AGENT_MAX_STEPS", "40"))
+AGENT_TIMEOUT = float(os.getenv("INVOICE_AGENT_TIMEOUT", "600"))
+AGENT_TOKEN_BUDGET = int(os.getenv("INVOICE_AGENT_TOKEN_BUDGET", "400000"))
+DOWNLOADS_DIR = Path(os.getenv("INVOICE_DOWNLOADS_DIR", "~/Downloads")).expanduser()
+
+# The agent reads the DOM (use_vision=False), so nothing it needs is lost
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}
+TRACKER_DOMAINS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "googlesyndication.com",
+    "facebook.net",
+    "hotjar.com",
+    "segment.com",
+    "segment.io",
+    "mixpanel.com",
+    "amplitude.com",
+    "fullstory.com",
+    "clarity.ms",
+    "hs-analytics.net",
+    "hs-scripts.com",
+    "intercomcdn.com",
+    "sentry.io",
+    "newrelic.com",
+    "nr-data.net",
+    "bat.bing.com",
+    "ads.linkedin.com",
+)
+
+
+def desktop_browser_profile() -> "BrowserProfile":
+    from browser_use import BrowserProfile
+
+    return BrowserProfile(
+        user_data_dir="~/.config/browseruse/profiles/default-google-chrome",
+        executable_path="/Applications/Google Chrome.app/Contents/MacOS/Google Chrome",
+        keep_alive=True,
+        downloads_path=DOWNLOADS_DIR,
+        # disable_security=True,
+    )
+
+
+def headless_browser_profile() -> "BrowserProfile":
+    from browser_use import BrowserProfile
+
+    return BrowserProfile(
+        headless=True,
+        # Playwright's bundled Chromium unless a system browser is configured
+        executable_path=os.getenv("INVOICE_BROWSER_EXECUTABLE_PATH"),
+        # No user data dir by default, so pooled browsers do not share a profile
+        # lock; merchant logins come from an exported storage state instead
+        user_data_dir=os.getenv("INVOICE_BROWSER_USER_DATA_DIR"),
+        storage_state=os.getenv("INVOICE_BROWSER_STORAGE_STATE"),
+        keep_alive=True,
+        downloads_path=DOWNLOADS_DIR,
+        args=["--blink-settings=imagesEnabled=false"] if BLOCK_RESOURCES else [],
+    )
+
+
+def browser_profile() -> "BrowserProfile":
+    if BROWSER_PROFILE == "headless":
+        return headless_browser_profile()
+    return desktop_browser_profile()
+
+
+def is_blocked_request(url: str, resource_type: str) -> bool:
+    if resource_type in BLOCKED_RESOURCE_TYPES:
+        return True
+    host = urlparse(url).hostname or ""
+    return any(
+        host == tracker or host.endswith(f".{tracker}") for tracker in TRACKER_DOMAINS
+    )
+
+
+async def _route_request(route) -> None:
+    if is_blocked_request(route.request.url, route.request.resource_type):
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+async def block_resources(browser_session: "BrowserSession") -> None:
+    """Abort image, font, media and tracker requests in the session's context.
+
+    Safe to call again on the same session, e.g. after a browser restart.
+    """
+    context = browser_session.browser_context
+    if not BLOCK_RESOURCES or context is None:
+        return
+    await context.unroute("**/*")
+    await context.route("**/*", _route_request)
+
+
+def navigation_path(history: "AgentHistoryList", domain: str) -> list[str]:
+    """Pages on `domain` the agent visited on its way to the invoice, in order.
+
+    Detours are cut at the first revisit of a page, so the path ends at the
+    page the invoice was downloaded from.
+    """
+    path: list[str] = []
+    for url in history.urls():
+        if not url or urlparse(url).path.lower().endswith(".pdf"):
+            continue
+        host = urlparse(url).hostname or ""
+        if host != domain and not host.endswith(f".{domain}"):
+            continue
+        if url in path:
+            del path[path.index(url) + 1 :]
+        else:
+            path.append(url)
+    return path
 
 
 async def create_agent(
@@ -25,7 +183,22 @@ async def create_agent(
     tx_amount: float,
     tx_reference: str,
     start_browser: bool = True,
+    browser_session: Optional["BrowserSession"] = None,
+    known_path: Optional[list[str]] = None,
 ):
+    from browser_use import Agent, BrowserSession, Controller
+
+    # Replaying a path that led to an invoice before skips rediscovering the site
+    if known_path:
+        known_navigation = f"""
+   **Known Navigation Path:**
+   Invoices on this website were previously found by visiting these pages in order:
+{chr(10).join(f"   - {url}" for url in known_path)}
+   You start on the last of these pages. If it does not show billing or invoices (for example because the page moved or you are logged out), fall back to exploring the website as described above.
+"""
+    else:
+        known_navigation = ""
+
     # Create a sophisticated task prompt that uses all parameters
     task_prompt = f"""
 You are an invoice retrieval specialist tasked with finding and downloading a specific invoice from {domainOrUrl}.
@@ -48,10 +221,7 @@ Find and download EXACTLY ONE invoice that most closely matches these transactio
    - Billing, Invoices, or Payment sections
    - Customer service or support areas
    - Search functionality
-   
-   **Domain-Specific Navigation:**
-   - For fly.io: Navigate directly to fly.io/dashboard/rentr/ for invoice access
-
+{known_navigation}
 2. **Invoice Identification**: When searching through invoices/transactions, look for entries that:
    - Have dates within the expected range (±30 days from {tx_date.strftime("%Y-%m-%d")})
    - Have amounts close to ${tx_amount:.2f} (allow ±20% variance for currency/tax differences)
@@ -85,22 +255,18 @@ Your task is COMPLETE and SUCCESSFUL when you have downloaded exactly ONE PDF in
 **REMEMBER: Your goal is achieved once you download ONE matching invoice PDF file. Do not download multiple files or continue searching after a successful download.**
 """
 
+    start_url = known_path[-1] if known_path else f"https://{domainOrUrl}"
     initial_actions = [
-        {"go_to_url": {"url": f"https://{domainOrUrl}", "new_tab": True}},
+        {"go_to_url": {"url": start_url, "new_tab": True}},
     ]
 
-    browser_session = BrowserSession(
-        browser_profile=BrowserProfile(
-            user_data_dir="~/.config/browseruse/profiles/default-google-chrome",
-            executable_path="/Applications/Google Chrome.app/Contents/MacOS/Google Chrome",
-            keep_alive=True,
-            downloads_path=Path("~/Downloads"),
-            # disable_security=True,
-        ),
-    )
+    # A leased session from the browser pool is already started
+    if browser_session is None:
+        browser_session = BrowserSession(browser_profile=browser_profile())
 
-    if start_browser:
-        await browser_session.start()
+        if start_browser:
+            await browser_session.start()
+            await block_resources(browser_session)
 
     controller = Controller(
         output_model=Result,
@@ -108,7 +274,7 @@ Your task is COMPLETE and SUCCESSFUL when you have downloaded exactly ONE PDF in
 
     agent = Agent(
         task=task_prompt,
-        llm=llm,
+        llm=agent_llm(),
         initial_actions=initial_actions,
         controller=controller,
         use_vision=False,
@@ -117,6 +283,129 @@ Your task is COMPLETE and SUCCESSFUL when you have downloaded exactly ONE PDF in
     return agent
 
 
+def downloaded_pdf(browser_session: "BrowserSession") -> Optional[str]:
+    pdfs = [
+        path
+        for path in browser_session.downloaded_files
+        if path.lower().endswith(".pdf")
+    ]
+    return pdfs[-1] if pdfs else None
+
+
+async def run_agent(
+    agent: "Agent",
+    *,
+    max_steps: int = AGENT_MAX_STEPS,
+    timeout: float = AGENT_TIMEOUT,
+    token_budget: int = AGENT_TOKEN_BUDGET,
+    downloads_path: Optional[Path] = None,
+) -> AgentRun:
+    """Run the agent within step, time and token budgets.
+
+    With `downloads_path`, the directory is watched and the run is cut short
+    the moment a finished PDF lands in it, instead of waiting for the agent to
+    notice and report the download.
+    """
+    stop_reason = None
+    downloaded_file_path = None
+    start = time.perf_counter()
+
+    def tokens() -> int:
+        return agent.token_cost_service.get_usage_tokens_for_model(
+            agent.llm.model
+        ).total_tokens
+
+    async def on_step_end(agent: "Agent") -> None:
+        nonlocal stop_reason
+        if downloaded_pdf(agent.browser_session):
+            stop_reason = "download"
+            agent.stop()
+        elif tokens() >= token_budget:
+            logger.warning(f"Agent reached its token budget of {token_budget}")
+            stop_reason = "token_budget"
+            agent.stop()
+
+    run_task = asyncio.create_task(
+        agent.run(max_steps=max_steps, on_step_end=on_step_end)
+    )
+    watch_task = (
+        asyncio.create_task(DownloadWatcher(downloads_path).wait())
+        if downloads_path
+        else None
+    )
+    try:
+        done, _ = await asyncio.wait(
+            [task for task in (run_task, watch_task) if task],
+            timeout=timeout,
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+        if run_task in done:
+            history = run_task.result()
+        else:
+            if watch_task in done:
+                downloaded_file_path = str(watch_task.result())
+                logger.info(
+                    f"Download finished, ending agent run: {downloaded_file_path}"
+                )
+                stop_reason = "download"
+            else:
+                logger.warning(f"Agent timed out after {timeout:g}s")
+                stop_reason = "timeout"
+            run_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await run_task
+            history = agent.state.history
+    finally:
+        for task in (run_task, watch_task):
+            if task:
+                task.cancel()
+
+    if history.is_done():
+        stop_reason = "done"
+    elif stop_reason is None:
+        stop_reason = "max_steps"
+
+    return AgentRun(
+        history=history,
+        downloaded_file_path=downloaded_file_path
+        or downloaded_pdf(agent.browser_session),
+        stats=AgentRunStats(
+            steps=history.number_of_steps(),
+            tokens=tokens(),
+            elapsed_seconds=round(time.perf_counter() - start, 3),
+            stop_reason=stop_reason,
+        ),
+    )
+
+
+async def benchmark_page_loads(urls: list[str], repeats: int = 3) -> None:
+    """Print the median page-load time of each url under both browser profiles."""
+    from browser_use import BrowserSession
+
+    for name, profile_factory, block in (
+        ("desktop", desktop_browser_profile, False),
+        ("headless", headless_browser_profile, True),
+    ):
+        browser_session = BrowserSession(browser_profile=profile_factory())
+        try:
+            await browser_session.start()
+            if block:
+                await block_resources(browser_session)
+            page = await browser_session.get_current_page()
+            for url in urls:
+                timings = []
+                for _ in range(repeats):
+                    await page.goto("about:blank")
+                    start = time.perf_counter()
+                    await page.goto(url, wait_until="load")
+                    timings.append(time.perf_counter() - start)
+                print(f"{name:<9} {statistics.median(timings) * 1000:8.0f} ms  {url}")
+        except Exception as e:
+            print(f"{name:<9} skipped: {e}")
+        finally:
+            await browser_session.kill()
+
+
 async def main():
     parser = argparse.ArgumentParser(description="Invoice retrieval agent")
 
@@ -125,18 +414,23 @@ async def main():
         action="store_true",
         help="Only start the browser session without running the agent",
     )
+    parser.add_argument(
+        "--benchmark",
+        nargs="+",
+        metavar="URL",
+        help="Compare page-load times of the desktop and headless browser profiles",
+    )
     args = parser.parse_args()
 
+    if args.benchmark:
+        await benchmark_page_loads(args.benchmark)
+        return
+
     if args.browser_only:
+        from browser_use import BrowserSession
+
         # Just start the browser session and keep it alive
-        browser_session = BrowserSession(
-            browser_profile=BrowserProfile(
-                user_data_dir="~/.config/browseruse/profiles/default-google-chrome",
-                executable_path="/Applications/Google Chrome.app/Contents/MacOS/Google Chrome",
-                keep_alive=True,
-                downloads_path=Path("~/Downloads"),
-            )
-        )
+        browser_session = BrowserSession(browser_profile=browser_profile())
         await browser_session.start()
         print("Browser session started. Press Ctrl+C to close.")
         try:
@@ -155,8 +449,9 @@ async def main():
         tx_reference="1234567890",
     )
 
-    result = await agent.run()
-    print(result.model_dump_json())
+    run = await run_agent(agent)
+    print(run.stats.model_dump_json())
+    print(run.history.model_dump_json())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, AsyncIterator, Awaitable, Callable, Optional
+
+if TYPE_CHECKING:
+    from browser_use import BrowserProfile, BrowserSession
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _IdleSession:
+    session: "BrowserSession"
+    idle_since: float = field(default_factory=time.monotonic)
+
+
+class BrowserPool:
+    """Pool of pre-started, keep-alive browser sessions leased to invoice agents.
+
+    Sessions are health-checked when leased and reset to a single blank tab when
+    returned. Idle sessions beyond `min_idle` are closed after `idle_timeout`
+    seconds, and at most `max_size` sessions are leased at once. `setup` is
+    awaited on every leased session, so it must be safe to repeat.
+    """
+
+    def __init__(
+        self,
+        profile_factory: Callable[[], "BrowserProfile"],
+        *,
+        max_size: int,
+        min_idle: int = 0,
+        idle_timeout: float = 300.0,
+        setup: Optional[Callable[["BrowserSession"], Awaitable[None]]] = None,
+    ):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.profile_factory = profile_factory
+        self.setup = setup
+        self.max_size = max_size
+        self.min_idle = min(min_idle, max_size)
+        self.idle_timeout = idle_timeout
+        self._idle: list[_IdleSession] = []
+        self._size = 0  # started sessions, idle or leased
+        self._slots = asyncio.Semaphore(max_size)
+        self._reaper: Optional[asyncio.Task] = None
+        self._closed = False
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def idle(self) -> int:
+        return len(self._idle)
+
+    @property
+    def leased(self) -> int:
+        return self._size - len(self._idle)
+
+    async def acquire(self, downloads_path: Optional[Path] = None) -> "BrowserSession":
+        """Lease a healthy session, starting a new browser only if none is idle.
+
+        Downloads during the lease are saved to `downloads_path` if given.
+        """
+        if self._closed:
+            raise RuntimeError("Browser pool is closed")
+        self._ensure_reaper()
+
+        await self._slots.acquire()
+        try:
+            session = await self._healthy_idle_session() or await self._start_session()
+            try:
+                if downloads_path:
+                    session.browser_profile.downloads_path = downloads_path
+                if self.setup:
+                    await self.setup(session)
+            except BaseException:
+                await self._discard(session)
+                raise
+            return session
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def release(self, session: "BrowserSession") -> None:
+        """Return a leased session, closing it if it cannot be reset."""
+        try:
+            if not self._closed and await self._reset(session):
+                self._idle.append(_IdleSession(session))
+            else:
+                await self._discard(session)
+        finally:
+            self._slots.release()
+
+    @asynccontextmanager
+    async def lease(
+        self, downloads_path: Optional[Path] = None
+    ) -> AsyncIterator["BrowserSession"]:
+        session = await self.acquire(downloads_path)
+        try:
+            yield session
+        finally:
+            await self.release(session)
+
+    async def warm(self) -> None:
+        """Start idle sessions up to `min_idle` so first requests skip browser startup."""
+        self._ensure_reaper()
+        while not self._closed and self._size < self.min_idle:
+            try:
+                session = await self._start_session()
+            except Exception as e:
+                logger.warning(f"Failed to pre-start pooled browser session: {e}")
+                return
+            self._idle.append(_IdleSession(session))
+
+    async def close(self) -> None:
+        """Close idle sessions; sessions still leased are closed when returned."""
+        self._closed = True
+        if self._reaper:
+            self._reaper.cancel()
+        idle, self._idle = self._idle, []
+        await asyncio.gather(*(self._discard(entry.session) for entry in idle))
+
+    async def _healthy_idle_session(self) -> Optional["BrowserSession"]:
+        while self._idle:
+            # Most recently returned first, so the oldest sessions can expire
+            session = self._idle.pop().session
+            if await session.is_connected(restart=True):
+                return session
+            logger.info("Discarding unhealthy pooled browser session")
+            await self._discard(session)
+        return None
+
+    async def _start_session(self) -> "BrowserSession":
+        from browser_use import BrowserSession
+
+        self._size += 1
+        try:
+            session = BrowserSession(browser_profile=self.profile_factory())
+            await session.start()
+        except BaseException:
+            self._size -= 1
+            raise
+        return session
+
+    async def _reset(self, session: "BrowserSession") -> bool:
+        """Close extra tabs and blank the remaining one so the next agent starts clean."""
+        try:
+            pages = session.browser_context.pages if session.browser_context else []
+            if not pages:
+                return False
+            for page in pages[1:]:
+                await page.close()
+            await pages[0].goto("about:blank")
+            session.agent_current_page = session.human_current_page = pages[0]
+            # Downloads tracked for the previous agent belong to its own directory
+            session._downloaded_files.clear()
+            return True
+        except Exception as e:
+            logger.warning(f"Failed to reset pooled browser session: {e}")
+            return False
+
+    async def _discard(self, session: "BrowserSession") -> None:
+        self._size -= 1
+        try:
+            await session.kill()
+        except Exception as e:
+            logger.warning(f"Failed to close pooled browser session: {e}")
+
+    def _ensure_reaper(self) -> None:
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap_idle())
+
+    async def _reap_idle(self) -> None:
+        while not self._closed:
+            await asyncio.sleep(min(self.idle_timeout, 30.0))
+            now = time.monotonic()
+            # Oldest sessions are at the front; always keep `min_idle` warm
+            surplus = len(self._idle) - self.min_idle
+            expired = [
+                entry
+                for entry in self._idle[: max(surplus, 0)]
+                if now - entry.idle_since > self.idle_timeout
+            ]
+            for entry in expired:
+                self._idle.remove(entry)
+                await self._discard(entry.session)
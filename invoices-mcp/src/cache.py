@@ -0,0 +1,297 @@
+import contextlib
+import datetime
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Hashable, Iterator, Optional
+
+CACHE_DIR = Path(
+    os.getenv("INVOICES_MCP_CACHE_DIR", "~/.cache/invoices-mcp")
+).expanduser()
+
+
+@contextmanager
+def sqlite_connection(path: Path) -> Iterator[sqlite3.Connection]:
+    """Open a SQLite connection that commits on success and is always closed."""
+    conn = sqlite3.connect(path, timeout=10)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def file_sha256(path: str | Path) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+@dataclass
+class CachedInvoice:
+    invoice_file_path: str
+    content: str  # ExtractedInvoiceContent as JSON
+
+
+class InvoiceResultCache:
+    """Durable map from transaction identity to its retrieved invoice.
+
+    A transaction is identified by merchant domain, reference, date and amount
+    (in cents). Entries whose PDF has since been deleted are treated as misses.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with sqlite_connection(path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS invoice_results (
+                    domain TEXT NOT NULL,
+                    reference TEXT NOT NULL,
+                    tx_date TEXT NOT NULL,
+                    amount_cents INTEGER NOT NULL,
+                    invoice_file_path TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (domain, reference, tx_date, amount_cents)
+                )
+                """
+            )
+
+    @staticmethod
+    def _key(
+        domain: str, reference: str, date: datetime.date, amount: float
+    ) -> tuple[str, str, str, int]:
+        return domain, reference, date.isoformat(), round(amount * 100)
+
+    def get(
+        self, *, domain: str, reference: str, date: datetime.date, amount: float
+    ) -> Optional[CachedInvoice]:
+        with sqlite_connection(self.path) as conn:
+            row = conn.execute(
+                """
+                SELECT invoice_file_path, content FROM invoice_results
+                WHERE domain = ? AND reference = ? AND tx_date = ? AND amount_cents = ?
+                """,
+                self._key(domain, reference, date, amount),
+            ).fetchone()
+        if row is None or not Path(row[0]).exists():
+            return None
+        return CachedInvoice(invoice_file_path=row[0], content=row[1])
+
+    def put(
+        self,
+        *,
+        domain: str,
+        reference: str,
+        date: datetime.date,
+        amount: float,
+        invoice_file_path: str,
+        content: str,
+    ) -> None:
+        with sqlite_connection(self.path) as conn:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO invoice_results
+                    (domain, reference, tx_date, amount_cents, invoice_file_path, content)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    *self._key(domain, reference, date, amount),
+                    invoice_file_path,
+                    content,
+                ),
+            )
+
+
+@dataclass
+class NavigationRecipe:
+    urls: list[str]  # pages visited on the merchant domain, ending at the invoice
+    failures: int  # failed runs since the recipe last led to an invoice
+
+
+class NavigationRecipeCache:
+    """Per-domain record of how the browser agent last reached an invoice.
+
+    A recipe is replaced by each successful run and dropped once runs seeded
+    with it have failed `max_failures` times in a row.
+    """
+
+    def __init__(self, path: Path, *, max_failures: int = 2):
+        self.path = path
+        self.max_failures = max_failures
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with sqlite_connection(path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS navigation_recipes (
+                    domain TEXT PRIMARY KEY,
+                    urls TEXT NOT NULL,
+                    failures INTEGER NOT NULL DEFAULT 0,
+                    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+                )
+                """
+            )
+            # Recipes used to store the agent's actions as well; they were never
+            # replayed, as element indices differ between page loads
+            columns = {
+                row[1] for row in conn.execute("PRAGMA table_info(navigation_recipes)")
+            }
+            if "actions" in columns:
+                with contextlib.suppress(sqlite3.OperationalError):
+                    conn.execute("ALTER TABLE navigation_recipes DROP COLUMN actions")
+
+    def get(self, domain: str) -> Optional[NavigationRecipe]:
+        with sqlite_connection(self.path) as conn:
+            row = conn.execute(
+                "SELECT urls, failures FROM navigation_recipes WHERE domain = ?",
+                (domain,),
+            ).fetchone()
+        if row is None:
+            return None
+        return NavigationRecipe(urls=json.loads(row[0]), failures=row[1])
+
+    def record_success(self, domain: str, *, urls: list[str]) -> None:
+        with sqlite_connection(self.path) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO navigation_recipes (domain, urls) VALUES (?, ?)",
+                (domain, json.dumps(urls)),
+            )
+
+    def record_failure(self, domain: str) -> None:
+        with sqlite_connection(self.path) as conn:
+            conn.execute(
+                "UPDATE navigation_recipes SET failures = failures + 1 WHERE domain = ?",
+                (domain,),
+            )
+            conn.execute(
+                "DELETE FROM navigation_recipes WHERE domain = ? AND failures >= ?",
+                (domain, self.max_failures),
+            )
+
+
+class OcrCache:
+    """Content-addressed store of parsed OCR annotations on local disk.
+
+    Entries are keyed by the SHA-256 of the PDF and the annotation schema
+    version. Once the store grows past `max_bytes`, the least recently used
+    entries are evicted.
+    """
+
+    def __init__(self, directory: Path, *, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, digest: str, schema_version: str) -> Path:
+        return self.directory / f"{digest}-{schema_version}.json"
+
+    def get(self, digest: str, schema_version: str) -> Optional[str]:
+        path = self._path(digest, schema_version)
+        try:
+            content = path.read_text()
+            os.utime(path)  # mark as recently used for eviction
+        except FileNotFoundError:
+            return None
+        return content
+
+    def put(self, digest: str, schema_version: str, content: str) -> None:
+        path = self._path(digest, schema_version)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(content)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        for path in self.directory.glob("*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+class VersionedCache:
+    """In-memory results that stay valid until the data they were computed from changes.
+
+    Values are stored under the version of the data they were computed from;
+    storing a value for a new version drops everything computed for older ones.
+    """
+
+    def __init__(self):
+        self._version: Optional[str] = None
+        self._values: dict = {}
+
+    def get(self, version: str, key: Hashable) -> Optional[Any]:
+        if version != self._version:
+            return None
+        return self._values.get(key)
+
+    def put(self, version: str, key: Hashable, value: Any) -> None:
+        if version != self._version:
+            self._version = version
+            self._values = {}
+        self._values[key] = value
+
+    def clear(self) -> None:
+        """Drop all values, for changes the data version does not capture."""
+        self._version = None
+        self._values = {}
+
+
+class SharedVersionedCache:
+    """VersionedCache stored in SQLite, shared by the worker processes of one host.
+
+    Values are pickled, so they must be picklable; keys are compared by repr.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with sqlite_connection(path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS versioned_values (
+                    key TEXT PRIMARY KEY,
+                    version TEXT NOT NULL,
+                    value BLOB NOT NULL
+                )
+                """
+            )
+
+    def get(self, version: str, key: Hashable) -> Optional[Any]:
+        with sqlite_connection(self.path) as conn:
+            row = conn.execute(
+                "SELECT value FROM versioned_values WHERE key = ? AND version = ?",
+                (repr(key), version),
+            ).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def put(self, version: str, key: Hashable, value: Any) -> None:
+        with sqlite_connection(self.path) as conn:
+            conn.execute("DELETE FROM versioned_values WHERE version != ?", (version,))
+            conn.execute(
+                "INSERT OR REPLACE INTO versioned_values (key, version, value) VALUES (?, ?, ?)",
+                (repr(key), version, pickle.dumps(value)),
+            )
+
+    def clear(self) -> None:
+        """Drop all values, for changes the data version does not capture."""
+        with sqlite_connection(self.path) as conn:
+            conn.execute("DELETE FROM versioned_values")
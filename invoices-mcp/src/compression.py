@@ -0,0 +1,137 @@
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Only text is worth compressing; tool results are JSON, either as plain JSON
+# responses or as server-sent events
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """The best encoding the client accepts: zstd if available, then gzip."""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    supported = ["zstd", "gzip"] if zstandard else ["gzip"]
+    candidates = [
+        encoding
+        for encoding in supported
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0
+    ]
+    # Ties go to the first supported encoding
+    return max(
+        candidates,
+        key=lambda encoding: accepted.get(encoding, accepted.get("*", 0.0)),
+        default=None,
+    )
+
+
+class _Compressor:
+    """Streaming compressor that flushes after every chunk, so each server-sent
+    event reaches the client as soon as it is sent."""
+
+    def __init__(self, encoding: str, level: Optional[int]):
+        if encoding == "zstd":
+            self._compressor = zstandard.ZstdCompressor(
+                level=level if level is not None else 3
+            ).compressobj()
+            self._flush_block = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        else:
+            # wbits 31: gzip container instead of a raw zlib stream
+            self._compressor = zlib.compressobj(
+                level if level is not None else 6, zlib.DEFLATED, 31
+            )
+            self._flush_block = zlib.Z_SYNC_FLUSH
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(
+            self._flush_block
+        )
+
+    def finish(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+class CompressionMiddleware:
+    """Compress HTTP responses with the encoding negotiated from Accept-Encoding.
+
+    Unlike starlette's GZipMiddleware this also offers zstd (with the optional
+    `zstandard` package) and compresses streamed responses chunk by chunk,
+    which is how the streamable HTTP transport returns tool results. Responses
+    sent in one piece below `minimum_size` bytes are left as they are.
+    """
+
+    def __init__(
+        self, app: ASGIApp, minimum_size: int = 1024, level: Optional[int] = None
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.level = level
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                # Held back until the first body chunk shows whether to compress
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                headers = MutableHeaders(raw=list(start.get("headers", [])))
+                content_type = headers.get("content-type", "")
+                if (
+                    "content-encoding" in headers
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                    or (not more_body and len(body) < self.minimum_size)
+                ):
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding, self.level)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if "content-length" in headers:
+                    del headers["content-length"]
+                await send({**start, "headers": headers.raw})
+
+            data = compressor.chunk(body) if more_body else compressor.finish(body)
+            await send(
+                {"type": "http.response.body", "body": data, "more_body": more_body}
+            )
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,136 @@
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+import sys
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Names browsers give files that are still being written
+PARTIAL_SUFFIXES = (".crdownload", ".part", ".download", ".tmp")
+
+# inotify(7) events for a file that was written and closed, or renamed into place
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def is_finished_pdf(path: Path) -> bool:
+    """Whether `path` is a complete PDF: not a partial download, with the PDF
+    header at the start and an end-of-file marker near the end."""
+    if path.name.startswith(".") or path.suffix.lower() in PARTIAL_SUFFIXES:
+        return False
+    try:
+        with open(path, "rb") as f:
+            if f.read(5) != b"%PDF-":
+                return False
+            f.seek(0, os.SEEK_END)
+            f.seek(max(f.tell() - 1024, 0))
+            return b"%%EOF" in f.read()
+    except OSError:
+        return False
+
+
+def finished_pdfs(directory: Path) -> list[Path]:
+    try:
+        paths = sorted(directory.iterdir(), key=lambda path: path.stat().st_mtime)
+    except OSError:
+        return []
+    return [path for path in paths if path.is_file() and is_finished_pdf(path)]
+
+
+class _Inotify:
+    """Minimal non-blocking inotify watch on a single directory (Linux only)."""
+
+    def __init__(self, directory: Path):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if (
+            libc.inotify_add_watch(
+                self.fd, os.fsencode(directory), _IN_CLOSE_WRITE | _IN_MOVED_TO
+            )
+            < 0
+        ):
+            os.close(self.fd)
+            raise OSError(
+                ctypes.get_errno(), f"inotify_add_watch failed for {directory}"
+            )
+
+    def read_names(self) -> list[str]:
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        names = []
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            names.append(os.fsdecode(data[offset : offset + length].rstrip(b"\0")))
+            offset += length
+        return names
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class DownloadWatcher:
+    """Waits for the first finished PDF to land in a download directory.
+
+    Uses inotify file events on Linux, so completion is noticed the moment the
+    browser closes or renames the file, and polls the directory elsewhere.
+    """
+
+    def __init__(self, directory: Path, *, poll_interval: float = 0.5):
+        self.directory = directory
+        self.poll_interval = poll_interval
+
+    async def wait(self) -> Path:
+        inotify: Optional[_Inotify] = None
+        if sys.platform.startswith("linux"):
+            try:
+                inotify = _Inotify(self.directory)
+            except OSError as e:
+                logger.warning(f"inotify unavailable, polling {self.directory}: {e}")
+
+        # Files finished before the watch was set up produce no events
+        if existing := finished_pdfs(self.directory):
+            if inotify:
+                inotify.close()
+            return existing[0]
+
+        if inotify is None:
+            return await self._poll()
+        try:
+            return await self._watch(inotify)
+        finally:
+            inotify.close()
+
+    async def _watch(self, inotify: _Inotify) -> Path:
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue[str] = asyncio.Queue()
+
+        def on_readable() -> None:
+            for name in inotify.read_names():
+                events.put_nowait(name)
+
+        loop.add_reader(inotify.fd, on_readable)
+        try:
+            while True:
+                path = self.directory / await events.get()
+                if is_finished_pdf(path):
+                    return path
+        finally:
+            loop.remove_reader(inotify.fd)
+
+    async def _poll(self) -> Path:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            if pdfs := finished_pdfs(self.directory):
+                return pdfs[0]
@@ -0,0 +1,132 @@
+import csv
+import datetime
+import json
+import os
+import uuid
+from decimal import Decimal
+from pathlib import Path
+from typing import Iterable, Literal, Mapping, Sequence
+
+from cache import CACHE_DIR
+
+ExportFormat = Literal["csv", "ndjson", "parquet"]
+
+# Parquet precision and scale for NUMERIC columns, which are declared without
+# one: room for any money amount, and values that do not fit raise instead of
+# being rounded
+PARQUET_DECIMAL = (38, 10)
+
+EXPORT_DIR = Path(
+    os.getenv("TRANSACTION_EXPORT_DIR", CACHE_DIR / "exports")
+).expanduser()
+
+
+def export_path(format: ExportFormat) -> Path:
+    EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    return EXPORT_DIR / f"transactions-{timestamp}-{uuid.uuid4().hex[:8]}.{format}"
+
+
+def _json_value(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        # As a string, like CSV: a JSON number is read back as a float
+        return str(value)
+    return value
+
+
+def write_export(
+    batches: Iterable[Sequence[Sequence]],
+    columns: Mapping[str, type],
+    path: Path,
+    format: ExportFormat,
+) -> int:
+    """Write row batches to `path` as they arrive and return the number of rows.
+
+    `columns` maps each column name to its Python type, in row order. Only one
+    batch is held in memory at a time. The file is written under a temporary
+    name and moved into place once complete.
+    """
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    try:
+        if format == "csv":
+            count = _write_csv(batches, columns, tmp_path)
+        elif format == "ndjson":
+            count = _write_ndjson(batches, columns, tmp_path)
+        else:
+            count = _write_parquet(batches, columns, tmp_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    os.replace(tmp_path, path)
+    return count
+
+
+def _write_csv(batches, columns, path: Path) -> int:
+    count = 0
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for batch in batches:
+            writer.writerows(batch)
+            count += len(batch)
+    return count
+
+
+def _write_ndjson(batches, columns, path: Path) -> int:
+    count = 0
+    with open(path, "w") as f:
+        for batch in batches:
+            f.writelines(
+                json.dumps(
+                    {column: _json_value(value) for column, value in zip(columns, row)}
+                )
+                + "\n"
+                for row in batch
+            )
+            count += len(batch)
+    return count
+
+
+def _write_parquet(batches, columns, path: Path) -> int:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError(
+            "Parquet export requires pyarrow; install invoices-mcp[parquet]"
+        ) from None
+
+    arrow_types = {
+        str: pa.string(),
+        bool: pa.bool_(),
+        int: pa.int64(),
+        float: pa.float64(),
+        Decimal: pa.decimal128(*PARQUET_DECIMAL),
+        datetime.date: pa.date32(),
+        datetime.datetime: pa.timestamp("us"),
+    }
+    schema = pa.schema(
+        [
+            (name, arrow_types.get(python_type, pa.string()))
+            for name, python_type in columns.items()
+        ]
+    )
+
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for batch in batches:
+            # One row group per batch
+            try:
+                arrays = [
+                    pa.array(values, type=field.type)
+                    for field, values in zip(schema, zip(*batch))
+                ]
+            except pa.ArrowInvalid as e:
+                raise ValueError(
+                    f"Cannot write Parquet: {e}; export as CSV or NDJSON instead"
+                ) from e
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            count += len(batch)
+    return count
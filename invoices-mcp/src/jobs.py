@@ -0,0 +1,224 @@
+import asyncio
+import datetime
+import logging
+import os
+import sqlite3
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, Literal, Optional
+
+from cache import sqlite_connection
+
+logger = logging.getLogger(__name__)
+
+JobStatus = Literal["queued", "running", "succeeded", "failed"]
+
+
+@dataclass
+class JobRecord:
+    job_id: str
+    status: JobStatus
+    request: str  # job input as JSON
+    result: Optional[str]  # job output as JSON, once succeeded
+    error: Optional[str]
+    created_at: str
+    started_at: Optional[str]
+    finished_at: Optional[str]
+    worker: Optional[str] = None  # process running the job, while running
+
+
+def _now() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+class JobStore:
+    """Durable record of background jobs and their results in SQLite."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with sqlite_connection(path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    request TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at TEXT NOT NULL,
+                    started_at TEXT,
+                    finished_at TEXT,
+                    worker TEXT
+                )
+                """
+            )
+            # Stores created before jobs recorded the process running them
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "worker" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN worker TEXT")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)"
+            )
+
+    def create(self, request: str) -> JobRecord:
+        job = JobRecord(
+            job_id=uuid.uuid4().hex,
+            status="queued",
+            request=request,
+            result=None,
+            error=None,
+            created_at=_now(),
+            started_at=None,
+            finished_at=None,
+        )
+        with sqlite_connection(self.path) as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, status, request, created_at) VALUES (?, ?, ?, ?)",
+                (job.job_id, job.status, job.request, job.created_at),
+            )
+        return job
+
+    def get(self, job_id: str) -> Optional[JobRecord]:
+        with sqlite_connection(self.path) as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return JobRecord(**row) if row else None
+
+    def recent(
+        self, *, status: Optional[JobStatus] = None, limit: int = 50
+    ) -> list[JobRecord]:
+        """Most recently created jobs first."""
+        with sqlite_connection(self.path) as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(
+                """
+                SELECT * FROM jobs WHERE ? IS NULL OR status = ?
+                ORDER BY created_at DESC LIMIT ?
+                """,
+                (status, status, limit),
+            ).fetchall()
+        return [JobRecord(**row) for row in rows]
+
+    def queued_ids(self) -> list[str]:
+        with sqlite_connection(self.path) as conn:
+            rows = conn.execute(
+                "SELECT job_id FROM jobs WHERE status = 'queued' ORDER BY created_at"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def claim(self, job_id: str, worker: str) -> bool:
+        """Mark a queued job running in `worker`; False if another worker got it first."""
+        with sqlite_connection(self.path) as conn:
+            cursor = conn.execute(
+                """
+                UPDATE jobs SET status = 'running', started_at = ?, worker = ?
+                WHERE job_id = ? AND status = 'queued'
+                """,
+                (_now(), worker, job_id),
+            )
+        return cursor.rowcount == 1
+
+    def mark_succeeded(self, job_id: str, result: str) -> None:
+        self._update(job_id, status="succeeded", result=result, finished_at=_now())
+
+    def mark_failed(self, job_id: str, error: str) -> None:
+        self._update(job_id, status="failed", error=error, finished_at=_now())
+
+    def requeue(self, job_id: str) -> None:
+        self._update(job_id, status="queued", started_at=None, worker=None)
+
+    def requeue_interrupted(self, worker: Optional[str] = None) -> int:
+        """Queue jobs left running by a previous process (or by `worker` only) again;
+        returns their count."""
+        with sqlite_connection(self.path) as conn:
+            cursor = conn.execute(
+                """
+                UPDATE jobs SET status = 'queued', started_at = NULL, worker = NULL
+                WHERE status = 'running' AND (? IS NULL OR worker = ?)
+                """,
+                (worker, worker),
+            )
+        return cursor.rowcount
+
+    def _update(self, job_id: str, **values) -> None:
+        assignments = ", ".join(f"{column} = ?" for column in values)
+        with sqlite_connection(self.path) as conn:
+            conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE job_id = ?",
+                (*values.values(), job_id),
+            )
+
+
+class JobQueue:
+    """Runs jobs from a JobStore on a fixed number of background workers.
+
+    `handler` receives the job's request JSON and returns its result JSON; an
+    exception marks the job failed. Jobs interrupted by a shutdown or crash
+    are queued again when the queue is started.
+
+    Several processes may run queues on the same store: each job is claimed
+    by exactly one of them. They must then not requeue interrupted jobs on
+    start, since those may be running in another process; whoever supervises
+    the processes requeues the jobs of the ones that die.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        handler: Callable[[str], Awaitable[str]],
+        *,
+        workers: int,
+    ):
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self.store = store
+        self.handler = handler
+        self.workers = workers
+        self._queue: asyncio.Queue[str] = asyncio.Queue()
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self, *, requeue_interrupted: bool = True) -> None:
+        """Resume jobs persisted by a previous process and start the workers."""
+        if self._tasks:
+            return
+        if requeue_interrupted and (interrupted := self.store.requeue_interrupted()):
+            logger.info(f"Re-queued {interrupted} interrupted jobs")
+        for job_id in self.store.queued_ids():
+            self._queue.put_nowait(job_id)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    def submit(self, request: str) -> JobRecord:
+        self.start()
+        job = self.store.create(request)
+        self._queue.put_nowait(job.job_id)
+        return job
+
+    async def close(self) -> None:
+        """Stop the workers; jobs they were running are queued again for next start."""
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _work(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            job = self.store.get(job_id)
+            if job is None or not self.store.claim(job_id, str(os.getpid())):
+                continue
+
+            try:
+                result = await self.handler(job.request)
+            except asyncio.CancelledError:
+                self.store.requeue(job_id)
+                raise
+            except Exception as e:
+                logger.warning(f"Job {job_id} failed: {e}")
+                self.store.mark_failed(job_id, str(e))
+            else:
+                self.store.mark_succeeded(job_id, result)
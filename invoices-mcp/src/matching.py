@@ -0,0 +1,252 @@
+import datetime
+import re
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+from typing import Mapping, Optional, Sequence
+
+import numpy as np
+
+# Same tolerances the invoice agent is given for finding an invoice
+DEFAULT_DATE_TOLERANCE_DAYS = 30
+DEFAULT_AMOUNT_TOLERANCE = 0.2
+
+# Weights of the component scores in a candidate's overall score
+DATE_WEIGHT = 0.25
+AMOUNT_WEIGHT = 0.35
+REFERENCE_WEIGHT = 0.25
+COUNTERPARTY_WEIGHT = 0.15
+
+_EPOCH = datetime.date(1970, 1, 1)
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+# Legal-form and domain noise that says nothing about who the counterparty is
+_COUNTERPARTY_NOISE = re.compile(
+    r"\b(?:inc|llc|ltd|gmbh|ag|bv|sas|sarl|corp|co|com|io|net|org|www|https?)\b"
+)
+
+
+def normalise(text: Optional[str]) -> str:
+    return _NON_ALNUM.sub(" ", (text or "").lower()).strip()
+
+
+def normalise_counterparty(text: Optional[str]) -> str:
+    return " ".join(_COUNTERPARTY_NOISE.sub(" ", normalise(text)).split())
+
+
+def counterparty_similarity(invoice_counterparty: str, transaction_text: str) -> float:
+    """1.0 if every word of the invoice's vendor appears in the transaction's
+    counterparty or description, otherwise how closely the two resemble."""
+    if not invoice_counterparty or not transaction_text:
+        return 0.0
+    if set(invoice_counterparty.split()) <= set(transaction_text.split()):
+        return 1.0
+    return SequenceMatcher(None, invoice_counterparty, transaction_text).ratio()
+
+
+@dataclass
+class InvoiceQuery:
+    invoice_date: datetime.date
+    invoice_amount: float
+    invoice_number: Optional[str] = None
+    counterparty: Optional[str] = None  # vendor name or domain
+
+
+@dataclass
+class Candidates:
+    """Scored (invoice, transaction) pairs as parallel arrays, best score first."""
+
+    invoice_index: np.ndarray
+    transaction_index: np.ndarray
+    score: np.ndarray
+    date_diff_days: np.ndarray
+    amount_diff_ratio: np.ndarray
+    reference_similarity: np.ndarray
+    counterparty_similarity: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.score)
+
+    def take(self, positions: np.ndarray) -> "Candidates":
+        return Candidates(
+            *(getattr(self, name)[positions] for name in self.__dataclass_fields__)
+        )
+
+    def top_per_invoice(self, k: int) -> "Candidates":
+        """The `k` best candidates of each invoice, grouped by invoice."""
+        order = np.lexsort((-self.score, self.invoice_index))
+        grouped = self.invoice_index[order]
+        group_start = np.searchsorted(grouped, grouped, "left")
+        rank = np.arange(len(order)) - group_start
+        return self.take(order[rank < k])
+
+
+class TransactionIndex:
+    """Transactions sorted by date, as arrays for vectorised window lookups.
+
+    Amounts are compared by absolute value, since bank debits are negative
+    while invoice totals are positive.
+    """
+
+    def __init__(self, rows: Sequence[Mapping]):
+        rows = [
+            row for row in rows if row["date"] is not None and row["amount"] is not None
+        ]
+        days = np.array([(row["date"] - _EPOCH).days for row in rows], dtype=np.int64)
+        order = np.argsort(days, kind="stable")
+
+        self.rows = [rows[i] for i in order]
+        self.days = days[order]
+        self.amounts = np.abs(
+            np.array([float(row["amount"]) for row in self.rows], dtype=np.float64)
+        )
+        # Reference and description without separators, for invoice number lookups
+        self._reference_texts = [
+            normalise(
+                f"{row.get('reference') or ''} {row.get('description') or ''}"
+            ).replace(" ", "")
+            for row in self.rows
+        ]
+        # Few distinct counterparties recur across many transactions, so their
+        # similarity is computed once per distinct pair
+        self._counterparties, self._counterparty_codes = np.unique(
+            np.array(
+                [
+                    normalise_counterparty(
+                        f"{row.get('counterparty') or ''} {row.get('description') or ''}"
+                    )
+                    for row in self.rows
+                ],
+                dtype=object,
+            ),
+            return_inverse=True,
+        )
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def candidates(
+        self,
+        invoices: Sequence[InvoiceQuery],
+        *,
+        date_tolerance_days: int = DEFAULT_DATE_TOLERANCE_DAYS,
+        amount_tolerance: float = DEFAULT_AMOUNT_TOLERANCE,
+    ) -> Candidates:
+        """Score every transaction within the tolerances of each invoice."""
+        invoice_days = np.array(
+            [(invoice.invoice_date - _EPOCH).days for invoice in invoices],
+            dtype=np.int64,
+        )
+        invoice_amounts = np.abs(
+            np.array([invoice.invoice_amount for invoice in invoices], dtype=np.float64)
+        )
+
+        # [lo, hi) is each invoice's date window in the sorted transactions
+        lo = np.searchsorted(self.days, invoice_days - date_tolerance_days, "left")
+        hi = np.searchsorted(self.days, invoice_days + date_tolerance_days, "right")
+        counts = hi - lo
+
+        # Expand the windows into flat (invoice, transaction) pairs
+        invoice_idx = np.repeat(np.arange(len(invoices)), counts)
+        starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+        transaction_idx = np.arange(counts.sum()) + starts
+
+        amount_ratio = np.abs(
+            self.amounts[transaction_idx] - invoice_amounts[invoice_idx]
+        ) / np.maximum(invoice_amounts[invoice_idx], 0.01)
+        within = amount_ratio <= amount_tolerance
+        invoice_idx = invoice_idx[within]
+        transaction_idx = transaction_idx[within]
+        amount_ratio = amount_ratio[within]
+        date_diff = self.days[transaction_idx] - invoice_days[invoice_idx]
+
+        reference = self._reference_similarity(invoices, invoice_idx, transaction_idx)
+        counterparty = self._counterparty_similarity(
+            invoices, invoice_idx, transaction_idx
+        )
+
+        score = (
+            DATE_WEIGHT * (1 - np.abs(date_diff) / max(date_tolerance_days, 1))
+            + AMOUNT_WEIGHT * (1 - amount_ratio / max(amount_tolerance, 1e-9))
+            + REFERENCE_WEIGHT * reference
+            + COUNTERPARTY_WEIGHT * counterparty
+        )
+        order = np.argsort(-score, kind="stable")
+        return Candidates(
+            invoice_index=invoice_idx[order],
+            transaction_index=transaction_idx[order],
+            score=score[order],
+            date_diff_days=date_diff[order],
+            amount_diff_ratio=amount_ratio[order],
+            reference_similarity=reference[order],
+            counterparty_similarity=counterparty[order],
+        )
+
+    def _reference_similarity(
+        self,
+        invoices: Sequence[InvoiceQuery],
+        invoice_idx: np.ndarray,
+        transaction_idx: np.ndarray,
+    ) -> np.ndarray:
+        """1.0 where the invoice number appears in the transaction's reference or
+        description."""
+        numbers = [
+            normalise(invoice.invoice_number).replace(" ", "") for invoice in invoices
+        ]
+        texts = self._reference_texts
+        return np.fromiter(
+            (
+                bool(numbers[i]) and numbers[i] in texts[t]
+                for i, t in zip(invoice_idx.tolist(), transaction_idx.tolist())
+            ),
+            dtype=np.float64,
+            count=len(invoice_idx),
+        )
+
+    def _counterparty_similarity(
+        self,
+        invoices: Sequence[InvoiceQuery],
+        invoice_idx: np.ndarray,
+        transaction_idx: np.ndarray,
+    ) -> np.ndarray:
+        invoice_counterparties, invoice_codes = np.unique(
+            np.array(
+                [normalise_counterparty(invoice.counterparty) for invoice in invoices],
+                dtype=object,
+            ),
+            return_inverse=True,
+        )
+        # One key per (invoice counterparty, transaction counterparty) pair
+        width = len(self._counterparties)
+        keys = (
+            invoice_codes[invoice_idx] * width
+            + self._counterparty_codes[transaction_idx]
+        )
+        pairs, pair_of_candidate = np.unique(keys, return_inverse=True)
+        similarities = np.array(
+            [
+                counterparty_similarity(
+                    invoice_counterparties[key // width],
+                    self._counterparties[key % width],
+                )
+                for key in pairs.tolist()
+            ],
+            dtype=np.float64,
+        )
+        return similarities[pair_of_candidate] if len(pairs) else similarities
+
+
+def assign_matches(candidates: Candidates, *, exclusive: bool = True) -> dict[int, int]:
+    """Pick the best candidate for each invoice, highest scores first.
+
+    Returns the position in `candidates` of each matched invoice's match. When
+    `exclusive`, a transaction is matched to at most one invoice.
+    """
+    matches: dict[int, int] = {}
+    taken: set[int] = set()
+    for position, (invoice, transaction) in enumerate(
+        zip(candidates.invoice_index.tolist(), candidates.transaction_index.tolist())
+    ):
+        if invoice in matches or (exclusive and transaction in taken):
+            continue
+        matches[invoice] = position
+        taken.add(transaction)
+    return matches
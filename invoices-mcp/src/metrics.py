@@ -0,0 +1,345 @@
+import asyncio
+import bisect
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterator, Literal, Optional, Sequence
+
+from fastmcp.server.middleware import Middleware, MiddlewareContext
+
+logger = logging.getLogger(__name__)
+
+# Tool calls range from milliseconds (queries) to minutes (browser agents)
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+    300.0,
+    600.0,
+)
+
+LabelValues = tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Registry:
+    """Metrics rendered together in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics: list = []
+
+    def register(self, metric) -> None:
+        self._metrics.append(metric)
+
+    def state(self) -> dict[str, dict[LabelValues, Any]]:
+        """Current values of every metric by name, as `render` takes them."""
+        return {metric.name: metric.state() for metric in self._metrics}
+
+    def render(self, state: Optional[dict[str, dict[LabelValues, Any]]] = None) -> str:
+        """Render the current values, or those in `state` (see SharedMetrics)."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            if state is None:
+                lines.extend(metric.samples())
+            else:
+                lines.extend(metric.samples(state.get(metric.name, {})))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        registry: Registry = REGISTRY,
+    ):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def state(self) -> dict[LabelValues, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def samples(self, state: Optional[dict[LabelValues, float]] = None) -> list[str]:
+        values = self.state() if state is None else state
+        return [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        registry: Registry = REGISTRY,
+    ):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: observations per bucket (last is +Inf), sum
+        self._counts: dict[LabelValues, list[int]] = {}
+        self._sums: dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def state(self) -> dict[LabelValues, list[float]]:
+        """Per label set: observations per bucket followed by their sum."""
+        with self._lock:
+            return {
+                key: [*counts, self._sums[key]] for key, counts in self._counts.items()
+            }
+
+    def samples(
+        self, state: Optional[dict[LabelValues, list[float]]] = None
+    ) -> list[str]:
+        entries = self.state() if state is None else state
+        lines = []
+        names = (*self.labels, "le")
+        for key, (*counts, total) in sorted(entries.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(names, (*key, _format_value(bound)))} {_format_value(cumulative)}"
+                )
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {_format_value(cumulative)}")
+        return lines
+
+
+class Gauge:
+    """Gauge whose values are read from `collect` when metrics are rendered.
+
+    `collect` returns a mapping from label values to the current value; a
+    metric without labels uses the empty tuple as its only key. `aggregate`
+    says how SharedMetrics combines the values of several workers: "sum" for
+    per-worker amounts, "max" for settings every worker reports the same.
+    """
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        collect: Callable[[], dict[LabelValues, Optional[float]]],
+        labels: Sequence[str] = (),
+        registry: Registry = REGISTRY,
+        aggregate: Literal["sum", "max"] = "sum",
+    ):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.collect = collect
+        self.aggregate = aggregate
+        registry.register(self)
+
+    def state(self) -> dict[LabelValues, float]:
+        return {
+            key: value for key, value in self.collect().items() if value is not None
+        }
+
+    def samples(self, state: Optional[dict[LabelValues, float]] = None) -> list[str]:
+        values = self.state() if state is None else state
+        return [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SharedMetrics:
+    """Metrics of every worker process on the host, added up for each scrape.
+
+    Each worker writes the state of its registry to `<directory>/<pid>.json`
+    every `interval` seconds, on exit and whenever it serves a scrape, which
+    then adds up the files of all workers. Counters and histograms include
+    the files of workers that have exited, so totals do not go backwards when
+    a worker is replaced; gauges only include the workers still running, and
+    those declared with aggregate="max" take the largest value instead.
+    """
+
+    def __init__(
+        self, directory: Path, registry: Registry = REGISTRY, interval: float = 1.0
+    ):
+        self.directory = directory
+        self.registry = registry
+        self.interval = interval
+
+    def reset(self) -> None:
+        """Remove the files of a previous run; call before starting the workers."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for path in self.directory.glob("*.json"):
+            path.unlink(missing_ok=True)
+
+    def write(self) -> None:
+        pid = os.getpid()
+        state = {
+            name: [[list(key), value] for key, value in values.items()]
+            for name, values in self.registry.state().items()
+        }
+        self.directory.mkdir(parents=True, exist_ok=True)
+        temporary = self.directory / f"{pid}.json.tmp"
+        temporary.write_text(json.dumps(state))
+        # Readers see either the previous file or this one, never a partial one
+        os.replace(temporary, self.directory / f"{pid}.json")
+
+    async def run(self) -> None:
+        """Write this worker's file every `interval` seconds until cancelled."""
+        while True:
+            try:
+                self.write()
+            except OSError as e:
+                logger.warning(f"Could not write metrics to {self.directory}: {e}")
+            await asyncio.sleep(self.interval)
+
+    def state(self) -> dict[str, dict[LabelValues, Any]]:
+        types = {metric.name: metric.type for metric in self.registry._metrics}
+        largest = {
+            metric.name
+            for metric in self.registry._metrics
+            if getattr(metric, "aggregate", "sum") == "max"
+        }
+        merged: dict[str, dict[LabelValues, Any]] = {name: {} for name in types}
+        for path in sorted(self.directory.glob("*.json")):
+            try:
+                state = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            alive = _process_alive(int(path.stem))
+            for name, entries in state.items():
+                if name not in types or (types[name] == "gauge" and not alive):
+                    continue
+                values = merged[name]
+                for key, value in entries:
+                    key = tuple(key)
+                    if types[name] == "histogram":
+                        previous = values.get(key, [0] * len(value))
+                        values[key] = [a + b for a, b in zip(previous, value)]
+                    elif name in largest:
+                        values[key] = max(values.get(key, value), value)
+                    else:
+                        values[key] = values.get(key, 0) + value
+        return merged
+
+    def render(self) -> str:
+        self.write()
+        return self.registry.render(self.state())
+
+
+TOOL_DURATION = Histogram(
+    "mcp_tool_duration_seconds", "Duration of MCP tool calls.", ["tool"]
+)
+TOOL_ERRORS = Counter(
+    "mcp_tool_errors_total", "MCP tool calls that raised an error.", ["tool"]
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "Cache lookups by cache and result.", ["cache", "result"]
+)
+OCR_DURATION = Histogram(
+    "ocr_duration_seconds", "Duration of Mistral OCR calls, including upload."
+)
+
+
+def record_cache_lookup(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+class ToolMetricsMiddleware(Middleware):
+    """Records the duration and errors of every tool call by tool name."""
+
+    async def on_call_tool(self, context: MiddlewareContext, call_next):
+        tool = context.message.name
+        start = time.perf_counter()
+        try:
+            return await call_next(context)
+        except Exception:
+            TOOL_ERRORS.inc(tool=tool)
+            raise
+        finally:
+            TOOL_DURATION.observe(time.perf_counter() - start, tool=tool)
@@ -1,20 +1,44 @@
+import itertools
+import logging
 import os
+import time
 from datetime import date as Date_Type
 from datetime import datetime as DateTime_Type
 from decimal import Decimal
-from typing import List, Optional
+from functools import cached_property
+from typing import Any, Dict, List, Literal, Optional, Required, TypedDict
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, TypeAdapter
 from sqlalchemy import (
+    BigInteger,
     Boolean,
     Date,
     DateTime,
+    Index,
     Numeric,
     String,
+    Table,
     Text,
     create_engine,
+    func,
+    literal_column,
 )
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, sessionmaker
+from sqlalchemy.dialects.postgresql import to_tsvector
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import (
+    DeclarativeBase,
+    Mapped,
+    Session,
+    mapped_column,
+    sessionmaker,
+)
+from sqlalchemy.pool import Pool
+from sqlalchemy.sql.schema import Column
+
+logger = logging.getLogger(__name__)
+
+# Seconds a read replica that could not be connected to is skipped
+REPLICA_RETRY_AFTER = float(os.getenv("DATABASE_REPLICA_RETRY_AFTER", "30"))
 
 
 class Base(DeclarativeBase):
@@ -39,6 +63,62 @@ class Transaction(Base):
     is_stripe_invoice: Mapped[Optional[bool]] = mapped_column(Boolean)
     is_invalid: Mapped[Optional[bool]] = mapped_column(Boolean)
     created_at: Mapped[Optional[DateTime_Type]] = mapped_column(DateTime)
+    # The invoice matched to the transaction, written back by update_transactions
+    invoice_number: Mapped[Optional[str]] = mapped_column(String)
+    invoice_file_path: Mapped[Optional[str]] = mapped_column(Text)
+
+
+# Per-day aggregates of transactions, one row per combination of the key
+# columns. Summaries read this instead of scanning transactions; it is rebuilt
+# by the website pipeline after each load and refreshed for the affected days
+# by update_transactions (see rollup.py). Key columns are nullable, so it has
+# no primary key. Income and expenses are told apart by the sign of the
+# amount, so the positive and negative amounts are summed separately.
+daily_rollup = Table(
+    "daily_rollup",
+    Base.metadata,
+    Column("date", Date, nullable=False),
+    Column("category", String),
+    Column("provider", String),
+    Column("currency", String),
+    Column("transaction_type", String),
+    Column("is_stripe_invoice", Boolean),
+    Column("is_invalid", Boolean),
+    Column("amount_sum", Numeric),
+    Column("transaction_count", BigInteger, nullable=False),
+    Column("amount_min", Numeric),
+    Column("amount_max", Numeric),
+    Column("positive_amount_sum", Numeric, nullable=False, server_default="0"),
+    Column("positive_count", BigInteger, nullable=False, server_default="0"),
+    Column("negative_amount_sum", Numeric, nullable=False, server_default="0"),
+    Column("negative_count", BigInteger, nullable=False, server_default="0"),
+    Index("idx_daily_rollup_date", "date"),
+    schema="ivy_data",
+)
+
+ROLLUP_KEY = [
+    "date",
+    "category",
+    "provider",
+    "currency",
+    "transaction_type",
+    "is_stripe_invoice",
+    "is_invalid",
+]
+
+
+# Word-search document over description and counterparty. It is rendered with
+# inline literals so that it matches the idx_transactions_search_tsv expression
+# index verbatim (see DATABASE_SETUP.md); the "simple" configuration does not
+# stem, so merchant names are matched as written.
+SEARCH_CONFIG = literal_column("'simple'::regconfig")
+
+transaction_search_document = to_tsvector(
+    SEARCH_CONFIG,
+    func.coalesce(Transaction.description, literal_column("''"))
+    + literal_column("' '")
+    + func.coalesce(Transaction.counterparty, literal_column("''")),
+)
 
 
 class TransactionResponse(BaseModel):
@@ -56,15 +136,116 @@ class TransactionResponse(BaseModel):
     is_stripe_invoice: Optional[bool] = None
     is_invalid: Optional[bool] = None
     created_at: Optional[str] = None
+    invoice_number: Optional[str] = None
+    invoice_file_path: Optional[str] = None
+
+
+TransactionField = Literal[
+    "transaction_id",
+    "date",
+    "amount",
+    "description",
+    "reference",
+    "category",
+    "currency",
+    "counterparty",
+    "provider",
+    "transaction_type",
+    "month_year",
+    "is_stripe_invoice",
+    "is_invalid",
+    "created_at",
+    "invoice_number",
+    "invoice_file_path",
+]
+
+# "rows" returns one object per transaction; "columns" maps each field to the
+# list of its values, so field names are sent once instead of once per row
+ResponseShape = Literal["rows", "columns"]
+
+
+class TransactionRow(TypedDict, total=False):
+    """A (possibly projected) transaction row as selected from the database.
+
+    Validated in bulk through `transaction_rows_adapter`, so column values are
+    coerced by pydantic-core instead of per-object Python conversions. Keys that
+    were not selected are simply absent from the row.
+    """
+
+    transaction_id: Required[str]
+    date: Optional[Date_Type]
+    amount: Optional[float]
+    description: Optional[str]
+    reference: Optional[str]
+    category: Optional[str]
+    currency: Optional[str]
+    counterparty: Optional[str]
+    provider: Optional[str]
+    transaction_type: Optional[str]
+    month_year: Optional[str]
+    is_stripe_invoice: Optional[bool]
+    is_invalid: Optional[bool]
+    created_at: Optional[DateTime_Type]
+    invoice_number: Optional[str]
+    invoice_file_path: Optional[str]
+
+
+transaction_rows_adapter = TypeAdapter(List[TransactionRow])
+
+
+def transaction_columns(fields: Optional[List[str]] = None) -> List[Column]:
+    """Core columns to select for a projection; the primary key is always included."""
+    table = Transaction.__table__
+    if not fields:
+        return list(table.columns)
+    names = dict.fromkeys(["transaction_id", *fields])
+    return [table.columns[name] for name in names]
 
 
 class TransactionListResponse(BaseModel):
     """Wrapper for list of transactions to comply with MCP spec requiring object outputs."""
 
-    transactions: List[TransactionResponse]
+    transactions: Optional[List[TransactionResponse]] = Field(
+        default=None, description="One object per transaction (shape 'rows')"
+    )
+    columns: Optional[Dict[str, List[Any]]] = Field(
+        default=None,
+        description="Each returned field mapped to its values, in row order (shape 'columns')",
+    )
     count: int
 
 
+class TransactionSearchResponse(TransactionListResponse):
+    """Ranked page of search results."""
+
+    next_offset: Optional[int] = None
+
+
+class TransactionLookupResponse(TransactionListResponse):
+    """Transactions found for a list of IDs, in request order."""
+
+    missing: List[str]
+
+
+class TransactionUpdate(BaseModel):
+    """Changes to one transaction; only the fields that are given are written."""
+
+    transaction_id: str
+    category: Optional[str] = None
+    is_invalid: Optional[bool] = None
+    invoice_number: Optional[str] = Field(
+        default=None, description="Number of the invoice matched to the transaction"
+    )
+    invoice_file_path: Optional[str] = Field(
+        default=None, description="Path of the invoice matched to the transaction"
+    )
+
+
+class TransactionUpdateResponse(BaseModel):
+    updated: int
+    missing: List[str] = Field(description="Requested IDs that do not exist")
+
+
 class TransactionSummaryResponse(BaseModel):
     """Response model for transaction summary statistics."""
 
@@ -77,19 +258,101 @@ class TransactionSummaryResponse(BaseModel):
 
 
 class DatabaseManager:
-    def __init__(self, database_url: str):
-        self.engine = create_engine(database_url)
-        self.SessionLocal = sessionmaker(
-            autocommit=False, autoflush=False, bind=self.engine
-        )
+    """Engine and session factory for the transactions database.
+
+    The engine (and its database driver) is only created on first use, so
+    servers that never query transactions do not pay for it at startup.
+
+    With `read_urls`, read-only work can be sent to read replicas through
+    `get_read_session`, while `get_session` always uses the primary.
+    """
+
+    def __init__(self, database_url: str, read_urls: Optional[List[str]] = None):
+        self.database_url = database_url
+        self.read_urls = list(read_urls or [])
+        self._next_replica = itertools.count()
+        self._replica_down_until = [0.0] * len(self.read_urls)
+
+    @cached_property
+    def engine(self):
+        return create_engine(self.database_url)
+
+    @cached_property
+    def read_engines(self):
+        # Pre-ping so pooled connections to a replica that restarted or went
+        # away are noticed on checkout, where the next replica can be tried
+        return [create_engine(url, pool_pre_ping=True) for url in self.read_urls]
+
+    @cached_property
+    def SessionLocal(self):
+        return sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+
+    @property
+    def started(self) -> bool:
+        return "engine" in self.__dict__
 
     def get_session(self):
+        """Session on the primary, for writes and reads that must see them."""
         return self.SessionLocal()
 
+    def get_read_session(self):
+        """Session for read-only queries, on the read replicas in turn.
+
+        A replica that cannot be connected to is skipped for
+        REPLICA_RETRY_AFTER seconds and the next one is tried; the primary is
+        used when there are no replicas or none is reachable. Replicas lag
+        behind the primary, so they may not yet show recent writes.
+        """
+        if not self.read_urls:
+            return self.get_session()
+
+        start = next(self._next_replica)
+        for offset in range(len(self.read_urls)):
+            index = (start + offset) % len(self.read_urls)
+            if self._replica_down_until[index] > time.monotonic():
+                continue
+            try:
+                connection = self.read_engines[index].connect()
+            except DBAPIError as e:
+                self._replica_down_until[index] = time.monotonic() + REPLICA_RETRY_AFTER
+                logger.warning(
+                    f"Read replica {index + 1} is unavailable, skipping it for {REPLICA_RETRY_AFTER:g}s: {e}"
+                )
+                continue
+            return _ReplicaSession(bind=connection, autoflush=False)
+
+        logger.debug("No read replica is available, reading from the primary")
+        return self.get_session()
+
+    def pools(self) -> Dict[str, Pool]:
+        """Connection pools of the engines created so far, by database."""
+        pools = {"primary": self.engine.pool} if self.started else {}
+        if "read_engines" in self.__dict__:
+            for index, engine in enumerate(self.read_engines, 1):
+                pools[f"replica-{index}"] = engine.pool
+        return pools
+
+
+class _ReplicaSession(Session):
+    """Session on a connection checked out from a replica, which goes back to
+    the pool when the session is closed."""
+
+    def close(self) -> None:
+        try:
+            super().close()
+        finally:
+            self.bind.close()
+
 
 # Initialize database manager with environment variable
 def get_database_manager():
     database_url = os.getenv("DATABASE_URL")
     if not database_url:
         raise ValueError("DATABASE_URL environment variable is required")
-    return DatabaseManager(database_url)
+    # Comma-separated URLs of read replicas for read-only tools
+    read_urls = [
+        url.strip()
+        for url in os.getenv("DATABASE_READ_URLS", "").split(",")
+        if url.strip()
+    ]
+    return DatabaseManager(database_url, read_urls=read_urls)
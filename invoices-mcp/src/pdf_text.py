@@ -0,0 +1,184 @@
+import datetime
+import logging
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from pypdf import PdfReader
+
+logger = logging.getLogger(__name__)
+
+# Invoice fields are on the first pages; skip the rest of long usage reports
+MAX_PAGES = 3
+
+CURRENCY_SYMBOLS = {"$": "USD", "€": "EUR", "£": "GBP", "¥": "JPY"}
+
+_MONTHS = (
+    "jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?"
+    "|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?"
+)
+DATE = rf"(?:\d{{4}}-\d{{2}}-\d{{2}}|(?:{_MONTHS})\.? \d{{1,2}},? \d{{4}}|\d{{1,2}} (?:{_MONTHS})\.? \d{{4}}|\d{{1,2}}\.\d{{1,2}}\.\d{{4}})"
+CURRENCY_CODES = "USD|EUR|GBP|CHF|JPY|CAD|AUD|NZD|SEK|NOK|DKK|PLN|CZK|HUF|INR|CNY|HKD|SGD|BRL|MXN|ZAR"
+# The code must follow on the same line; the next line often starts with a
+# capitalised word such as "VAT"
+MONEY = rf"(?P<symbol>[$€£¥])?\s?(?P<value>(?:\d{{1,3}}(?:[,. ]\d{{3}})+|\d+)(?:[.,]\d{{2}})?)(?!\d)(?:[ \t]?(?P<code>(?-i:{CURRENCY_CODES}))\b)?"
+# "Total" on its own, not "Subtotal", "Sub total" or "Sub-total"
+TOTAL = r"(?<!sub\s)(?<!sub-)\btotal\b"
+# Upper-case letters, digits and dashes, with at least one digit
+NUMBER = r"((?-i:(?=[A-Z-]*\d)[A-Z0-9][A-Z0-9-]{3,}))"
+
+
+@dataclass
+class VendorPatterns:
+    """Regexes locating each invoice field; each must capture the value as group 1
+    (or the MONEY groups for the amount)."""
+
+    number: list[str]
+    date: list[str]
+    amount: list[str]
+    currency: list[str] = field(default_factory=list)
+
+
+GENERIC_PATTERNS = VendorPatterns(
+    number=[
+        rf"invoice\s*(?:number|no\.?|#|nr\.?)\s*:?\s*{NUMBER}",
+        rf"rechnungsnummer\s*:?\s*{NUMBER}",
+    ],
+    date=[
+        rf"(?:date of issue|invoice date|date issued|issue date|rechnungsdatum)\s*:?\s*({DATE})",
+        rf"\bdate\s*:?\s*({DATE})",
+    ],
+    # Tried in order: the amount payable first, a plain total (which may be
+    # next to a subtotal and tax lines) only if there is none
+    amount=[
+        rf"(?:total amount due|amount due|total due|balance due|amount paid|grand total)\s*(?:\([A-Z]{{3}}\))?\s*:?\s*{MONEY}",
+        rf"{TOTAL}\s*(?:\([A-Z]{{3}}\))?\s*:?\s*{MONEY}",
+    ],
+    currency=[rf"\b((?-i:{CURRENCY_CODES}))\b"],
+)
+
+# Stripe-hosted invoices (fly.io and most other SaaS billing) share one layout
+STRIPE_PATTERNS = VendorPatterns(
+    number=[rf"invoice number\s*{NUMBER}"],
+    date=[rf"date of issue\s*({DATE})"],
+    amount=[rf"amount (?:due|paid)\s*{MONEY}", rf"{TOTAL}\s*{MONEY}"],
+    currency=GENERIC_PATTERNS.currency,
+)
+
+GOOGLE_CLOUD_PATTERNS = VendorPatterns(
+    number=[r"invoice number\s*:?\s*(\d{6,})"],
+    date=[rf"invoice date\s*:?\s*({DATE})"],
+    amount=[rf"total amount due\s*(?:in [A-Z]{{3}})?\s*:?\s*{MONEY}"],
+    currency=[r"total amount due in ((?-i:[A-Z]{3}))", *GENERIC_PATTERNS.currency],
+)
+
+VENDOR_PATTERNS = {
+    "fly.io": STRIPE_PATTERNS,
+    "stripe.com": STRIPE_PATTERNS,
+    "cloud.google.com": GOOGLE_CLOUD_PATTERNS,
+    "console.cloud.google.com": GOOGLE_CLOUD_PATTERNS,
+    "payments.google.com": GOOGLE_CLOUD_PATTERNS,
+}
+
+
+# Scale of the confidence of generic patterns: below the default
+# LOCAL_EXTRACTION_MIN_CONFIDENCE of 0.9, so unknown vendors go to OCR unless
+# the threshold is lowered
+GENERIC_CONFIDENCE = 0.8
+
+
+@dataclass
+class LocalExtraction:
+    fields: dict[str, str | float]
+    confidence: float
+
+
+def extract_pdf_text(pdf_path: str | Path) -> str:
+    reader = PdfReader(pdf_path)
+    return "\n".join(page.extract_text() or "" for page in reader.pages[:MAX_PAGES])
+
+
+def parse_amount(value: str) -> float:
+    """Parse '1,234.56', '1.234,56' or '1 234,56' into a float."""
+    value = value.replace(" ", "")
+    if "," in value and "." in value:
+        decimal = "," if value.rfind(",") > value.rfind(".") else "."
+    elif "," in value:
+        decimal = "," if len(value) - value.rfind(",") == 3 else None
+    else:
+        decimal = "." if "." in value and len(value) - value.rfind(".") == 3 else None
+    thousands = {",", "."} - {decimal}
+    for separator in thousands:
+        value = value.replace(separator, "")
+    return float(value.replace(",", ".") if decimal == "," else value)
+
+
+def parse_date(value: str) -> Optional[datetime.date]:
+    value = re.sub(r"\s+", " ", value.replace(",", "").replace(".", " ")).strip()
+    for fmt in ("%Y-%m-%d", "%B %d %Y", "%b %d %Y", "%d %B %Y", "%d %b %Y", "%d %m %Y"):
+        try:
+            return datetime.datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    # strptime's %b does not accept "Sept"
+    if "sept" in value.lower():
+        return parse_date(re.sub("(?i)sept", "Sep", value))
+    return None
+
+
+def _search(patterns: list[str], text: str) -> Optional[re.Match]:
+    for pattern in patterns:
+        if match := re.search(pattern, text, re.IGNORECASE):
+            return match
+    return None
+
+
+def extract_invoice_fields(text: str, domain: Optional[str] = None) -> LocalExtraction:
+    """Find the invoice fields in a PDF text layer with the patterns for `domain`.
+
+    Confidence is the share of the four fields found; a vendor without its own
+    patterns is parsed with the generic ones and scored lower.
+    """
+    patterns = VENDOR_PATTERNS.get(domain or "", GENERIC_PATTERNS)
+    text = re.sub(r"[ \t\u00a0]+", " ", text)
+    fields: dict[str, str | float] = {}
+
+    if match := _search(patterns.number, text):
+        fields["invoice_number"] = match.group(1)
+
+    if (match := _search(patterns.date, text)) and (date := parse_date(match.group(1))):
+        fields["invoice_date"] = date.isoformat()
+
+    if match := _search(patterns.amount, text):
+        try:
+            fields["invoice_amount"] = parse_amount(match.group("value"))
+        except ValueError:
+            pass
+        # A symbol next to the amount wins over a code after it
+        currency = CURRENCY_SYMBOLS.get(match.group("symbol")) or match.group("code")
+        if currency:
+            fields["invoice_currency"] = currency.upper()
+
+    if "invoice_currency" not in fields and (match := _search(patterns.currency, text)):
+        fields["invoice_currency"] = match.group(1).upper()
+
+    confidence = len(fields) / 4
+    if patterns is GENERIC_PATTERNS:
+        confidence *= GENERIC_CONFIDENCE
+    return LocalExtraction(fields=fields, confidence=confidence)
+
+
+def extract_invoice_fields_from_pdf(
+    pdf_path: str | Path, domain: Optional[str] = None
+) -> LocalExtraction:
+    try:
+        text = extract_pdf_text(pdf_path)
+    except Exception as e:
+        logger.warning(f"Could not read PDF text layer of {pdf_path}: {e}")
+        return LocalExtraction(fields={}, confidence=0.0)
+
+    # Scanned PDFs have no text layer and need OCR
+    if len(text.strip()) < 20:
+        return LocalExtraction(fields={}, confidence=0.0)
+    return extract_invoice_fields(text, domain)
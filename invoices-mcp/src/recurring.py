@@ -0,0 +1,182 @@
+import datetime
+import re
+from dataclasses import dataclass
+from typing import Mapping, Optional, Sequence
+
+import numpy as np
+from matching import normalise_counterparty
+
+# Typical billing periods in days, and how far a median interval may deviate
+# from one (relatively) to be classed as that cadence
+CADENCES = {
+    "weekly": 7.0,
+    "biweekly": 14.0,
+    "monthly": 30.44,
+    "quarterly": 91.31,
+    "yearly": 365.25,
+}
+CADENCE_TOLERANCE = 0.15
+
+DEFAULT_MIN_OCCURRENCES = 3
+DEFAULT_MIN_REGULARITY = 0.75
+DEFAULT_MAX_AMOUNT_VARIATION = 0.25
+
+_EPOCH = datetime.date(1970, 1, 1)
+_HAS_DIGIT = re.compile(r"\S*\d\S*")
+
+
+def charge_key(counterparty: Optional[str], description: Optional[str]) -> str:
+    """Who a charge is paid to: the counterparty, or else the description
+    without invoice numbers, dates and other tokens containing digits."""
+    if key := normalise_counterparty(counterparty):
+        return key
+    return " ".join(_HAS_DIGIT.sub(" ", normalise_counterparty(description)).split())
+
+
+@dataclass
+class RecurringCharge:
+    key: str
+    counterparty: str  # as written on the most recent charge
+    currency: Optional[str]
+    cadence: str
+    interval_days: float  # median days between charges
+    regularity: float  # share of intervals within tolerance of the median
+    occurrences: int
+    first_date: datetime.date
+    last_date: datetime.date
+    next_expected_date: datetime.date
+    average_amount: float
+    last_amount: float
+    amount_variation: float  # coefficient of variation of the amounts
+    total_amount: float
+
+
+def _cadence(interval_days: np.ndarray) -> np.ndarray:
+    """Index into CADENCES of each interval's cadence, or -1 if none fits."""
+    periods = np.array(list(CADENCES.values()))
+    deviation = np.abs(interval_days[:, None] - periods) / periods
+    nearest = deviation.argmin(axis=1)
+    fits = deviation[np.arange(len(interval_days)), nearest] <= CADENCE_TOLERANCE
+    return np.where(fits, nearest, -1)
+
+
+def find_recurring_charges(
+    rows: Sequence[Mapping],
+    *,
+    min_occurrences: int = DEFAULT_MIN_OCCURRENCES,
+    min_regularity: float = DEFAULT_MIN_REGULARITY,
+    max_amount_variation: float = DEFAULT_MAX_AMOUNT_VARIATION,
+) -> list[RecurringCharge]:
+    """Find counterparties that are charged at a regular cadence with stable amounts.
+
+    `rows` are charges with date, amount, currency, counterparty and
+    description. They are grouped by counterparty and currency, charges on the
+    same day are combined, and the intervals between consecutive charges of
+    each group are summarised with array operations over the whole history.
+    """
+    rows = [row for row in rows if row["date"] is not None and row["amount"]]
+    if not rows:
+        return []
+
+    keys = [
+        (charge_key(row["counterparty"], row["description"]), row["currency"] or "")
+        for row in rows
+    ]
+    key_labels, key_codes = np.unique(
+        np.array([f"{name}\x00{currency}" for name, currency in keys], dtype=object),
+        return_inverse=True,
+    )
+    days = np.array([(row["date"] - _EPOCH).days for row in rows], dtype=np.int64)
+    amounts = np.abs(np.array([float(row["amount"]) for row in rows]))
+
+    # One charge per group and day, in (group, day) order
+    day_span = days.max() - days.min() + 1
+    charge_ids, row_charge = np.unique(
+        key_codes * day_span + (days - days.min()), return_inverse=True
+    )
+    groups = charge_ids // day_span
+    charge_days = charge_ids % day_span + days.min()
+    charge_amounts = np.bincount(row_charge, weights=amounts)
+    # The latest row of each charge, for the counterparty name as written
+    latest_row = np.zeros(len(charge_ids), dtype=np.int64)
+    latest_row[row_charge] = np.arange(len(rows))
+
+    group_ids, group_start, occurrences = np.unique(
+        groups, return_index=True, return_counts=True
+    )
+    group_end = group_start + occurrences - 1
+    candidate = occurrences >= max(min_occurrences, 2)
+
+    # Intervals between consecutive charges of the same group
+    same_group = groups[1:] == groups[:-1]
+    interval_group = np.searchsorted(group_ids, groups[1:][same_group])
+    intervals = np.diff(charge_days)[same_group].astype(np.float64)
+
+    # Median interval per group from the intervals sorted within each group
+    order = np.lexsort((intervals, interval_group))
+    sorted_intervals = intervals[order]
+    interval_count = occurrences - 1
+    interval_start = np.cumsum(interval_count) - interval_count
+    median = np.zeros(len(group_ids))
+    has = interval_count > 0
+    median[has] = (
+        sorted_intervals[interval_start[has] + (interval_count[has] - 1) // 2]
+        + sorted_intervals[interval_start[has] + interval_count[has] // 2]
+    ) / 2
+
+    cadence = np.full(len(group_ids), -1)
+    cadence[candidate] = _cadence(median[candidate])
+    periods = np.array(list(CADENCES.values()))
+    expected = np.where(cadence >= 0, periods[cadence], median)
+    on_cadence = (
+        np.abs(intervals - expected[interval_group])
+        <= CADENCE_TOLERANCE * expected[interval_group]
+    )
+    regularity = np.bincount(
+        interval_group, weights=on_cadence, minlength=len(group_ids)
+    ) / np.maximum(interval_count, 1)
+
+    # Amount stability per group
+    charge_group = np.searchsorted(group_ids, groups)
+    totals = np.bincount(charge_group, weights=charge_amounts)
+    mean = totals / occurrences
+    variance = (
+        np.bincount(charge_group, weights=charge_amounts**2) / occurrences - mean**2
+    )
+    variation = np.sqrt(np.maximum(variance, 0)) / np.maximum(mean, 1e-9)
+
+    recurring = np.flatnonzero(
+        candidate
+        & (cadence >= 0)
+        & (regularity >= min_regularity)
+        & (variation <= max_amount_variation)
+    )
+    cadence_names = list(CADENCES)
+    charges = []
+    for g in recurring.tolist():
+        name, currency = key_labels[group_ids[g]].split("\x00")
+        if not name:
+            continue
+        latest = rows[latest_row[group_end[g]]]
+        last_date = _EPOCH + datetime.timedelta(days=int(charge_days[group_end[g]]))
+        charges.append(
+            RecurringCharge(
+                key=name,
+                counterparty=latest["counterparty"] or latest["description"] or name,
+                currency=currency or None,
+                cadence=cadence_names[cadence[g]],
+                interval_days=float(median[g]),
+                regularity=float(regularity[g]),
+                occurrences=int(occurrences[g]),
+                first_date=_EPOCH
+                + datetime.timedelta(days=int(charge_days[group_start[g]])),
+                last_date=last_date,
+                next_expected_date=last_date
+                + datetime.timedelta(days=round(periods[cadence[g]])),
+                average_amount=float(mean[g]),
+                last_amount=float(charge_amounts[group_end[g]]),
+                amount_variation=float(variation[g]),
+                total_amount=float(totals[g]),
+            )
+        )
+    return charges
@@ -0,0 +1,69 @@
+import datetime
+from typing import Iterable, Optional
+
+from models import ROLLUP_KEY, Transaction, daily_rollup
+from sqlalchemy import Date, case, delete, func, insert, select, text
+
+# The day a transaction is rolled up under. website/src/daily_rollup.py buckets
+# by the same expression; on a DATE column it is a no-op that keeps the index
+# on date usable, and unlike CAST it also works on SQLite
+ROLLUP_DAY = func.date(Transaction.date, type_=Date)
+
+# Taken by every writer of the rollup, here and in the website pipeline, so
+# two refreshes of a day never both delete and then both insert its rows. It
+# still lets summaries read the table.
+LOCK_DAILY_ROLLUP = "LOCK TABLE ivy_data.daily_rollup IN SHARE ROW EXCLUSIVE MODE"
+
+
+def refresh_daily_rollup(
+    session, dates: Optional[Iterable[datetime.date]] = None
+) -> None:
+    """Recompute the daily_rollup rows of `dates` from transactions.
+
+    Without `dates` the whole table is rebuilt. Runs in the caller's
+    transaction, so the rollup changes together with the transactions; on
+    Postgres that transaction also holds a lock on the rollup until it ends.
+    """
+    table = Transaction.__table__
+    keys = [ROLLUP_DAY if name == "date" else table.c[name] for name in ROLLUP_KEY]
+    positive = Transaction.amount > 0
+    negative = Transaction.amount < 0
+    aggregates = select(
+        *keys,
+        func.sum(Transaction.amount),
+        func.count(),
+        func.min(Transaction.amount),
+        func.max(Transaction.amount),
+        func.sum(case((positive, Transaction.amount), else_=0)),
+        func.count(case((positive, 1))),
+        func.sum(case((negative, Transaction.amount), else_=0)),
+        func.count(case((negative, 1))),
+    ).where(Transaction.date.is_not(None))
+    clear = delete(daily_rollup)
+
+    if dates is not None:
+        dates = sorted(set(date for date in dates if date is not None))
+        if not dates:
+            return
+        aggregates = aggregates.where(ROLLUP_DAY.in_(dates))
+        clear = clear.where(daily_rollup.c.date.in_(dates))
+
+    if session.get_bind().dialect.name == "postgresql":
+        session.execute(text(LOCK_DAILY_ROLLUP))
+    session.execute(clear)
+    session.execute(
+        insert(daily_rollup).from_select(
+            [
+                *ROLLUP_KEY,
+                "amount_sum",
+                "transaction_count",
+                "amount_min",
+                "amount_max",
+                "positive_amount_sum",
+                "positive_count",
+                "negative_amount_sum",
+                "negative_count",
+            ],
+            aggregates.group_by(*keys),
+        )
+    )
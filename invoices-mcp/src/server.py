@@ -1,29 +1,141 @@
 import asyncio
-import base64
+import contextlib
 import datetime
+import functools
+import hashlib
+import json
 import logging
 import os
-from typing import Annotated, Optional
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+from typing import TYPE_CHECKING, Annotated, List, Literal, Optional
 
-from agent import Result, create_agent
+import fastmcp
+import pydantic_core
+import uvicorn
+from agent import (
+    DOWNLOADS_DIR,
+    AgentRunStats,
+    Result,
+    block_resources,
+    browser_profile,
+    create_agent,
+    navigation_path,
+    run_agent,
+)
+from browser_pool import BrowserPool
+from cache import (
+    CACHE_DIR,
+    InvoiceResultCache,
+    NavigationRecipeCache,
+    OcrCache,
+    SharedVersionedCache,
+    VersionedCache,
+    file_sha256,
+)
+from compression import CompressionMiddleware
 from dotenv import load_dotenv
-from fastmcp import FastMCP
-from mistralai import Mistral
-from mistralai.extra import response_format_from_pydantic_model
+from export import ExportFormat, export_path, write_export
+from fastmcp import Context, FastMCP
+from fastmcp.tools.tool import ToolResult
+from jobs import JobQueue, JobRecord, JobStatus, JobStore
+from matching import (
+    DEFAULT_AMOUNT_TOLERANCE,
+    DEFAULT_DATE_TOLERANCE_DAYS,
+    InvoiceQuery,
+    TransactionIndex,
+    assign_matches,
+)
+from mcp.types import TextContent
+from metrics import (
+    OCR_DURATION,
+    REGISTRY,
+    Gauge,
+    SharedMetrics,
+    ToolMetricsMiddleware,
+    record_cache_lookup,
+)
 from models import (
+    SEARCH_CONFIG,
+    ResponseShape,
     Transaction,
+    TransactionField,
     TransactionListResponse,
+    TransactionLookupResponse,
     TransactionResponse,
+    TransactionSearchResponse,
     TransactionSummaryResponse,
+    TransactionUpdate,
+    TransactionUpdateResponse,
+    daily_rollup,
     get_database_manager,
+    transaction_columns,
+    transaction_rows_adapter,
+    transaction_search_document,
 )
-from openai import OpenAI
-from pydantic import BaseModel, Field
+from pdf_text import extract_invoice_fields_from_pdf
+from pydantic import BaseModel, Field, ValidationError
+from recurring import (
+    DEFAULT_MAX_AMOUNT_VARIATION,
+    DEFAULT_MIN_OCCURRENCES,
+    DEFAULT_MIN_REGULARITY,
+    find_recurring_charges,
+)
+from rollup import refresh_daily_rollup
+from sqlalchemy import (
+    String,
+    any_,
+    bindparam,
+    case,
+    cast,
+    column,
+    func,
+    null,
+    or_,
+    select,
+    union_all,
+    update,
+    values,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, websearch_to_tsquery
+from starlette.middleware import Middleware
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from workers import SharedSemaphore, lock_name, share, supervise
+
+if TYPE_CHECKING:
+    from mistralai import Mistral
+    from mistralai.models import OCRResponse
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+MAX_CONCURRENT_AGENTS = int(os.getenv("INVOICE_MAX_CONCURRENT_AGENTS", "4"))
+MAX_AGENTS_PER_DOMAIN = int(os.getenv("INVOICE_MAX_AGENTS_PER_DOMAIN", "1"))
+LOCAL_EXTRACTION_MIN_CONFIDENCE = float(
+    os.getenv("LOCAL_EXTRACTION_MIN_CONFIDENCE", "0.9")
+)
+# Page images are never used, only the document annotation
+OCR_INCLUDE_IMAGE_BASE64 = os.getenv("OCR_INCLUDE_IMAGE_BASE64", "false") == "true"
+INVOICE_JOB_WORKERS = int(os.getenv("INVOICE_JOB_WORKERS", str(MAX_CONCURRENT_AGENTS)))
+# Rows fetched from the server-side cursor and written per batch by exports
+EXPORT_BATCH_SIZE = int(os.getenv("TRANSACTION_EXPORT_BATCH_SIZE", "5000"))
+BROWSER_POOL_MIN_IDLE = int(os.getenv("BROWSER_POOL_MIN_IDLE", "1"))
+BROWSER_POOL_IDLE_TIMEOUT = float(os.getenv("BROWSER_POOL_IDLE_TIMEOUT", "300"))
+MCP_PORT = int(os.getenv("MCP_PORT", "8001"))
+# Processes serving the HTTP port; above 1, limits and caches are shared through
+# lock files and SQLite in LOCK_DIR and CACHE_DIR
+MCP_WORKERS = int(os.getenv("MCP_WORKERS", "1"))
+LOCK_DIR = Path(os.getenv("INVOICES_MCP_LOCK_DIR", CACHE_DIR / "locks")).expanduser()
+METRICS_DIR = Path(
+    os.getenv("INVOICES_MCP_METRICS_DIR", CACHE_DIR / "metrics")
+).expanduser()
+# HTTP responses are compressed (zstd or gzip, as negotiated) from this many
+# bytes up; -1 turns compression off
+HTTP_COMPRESSION_MIN_SIZE = int(os.getenv("HTTP_COMPRESSION_MIN_SIZE", "1024"))
+
 
 class ExtractedInvoiceContent(BaseModel):
     invoice_date: str = Field(
@@ -34,26 +146,167 @@ class ExtractedInvoiceContent(BaseModel):
     invoice_currency: str = Field(description="The currency of the invoice")
 
 
+# Changes whenever the annotation schema changes, invalidating cached OCR results
+OCR_SCHEMA_VERSION = hashlib.sha256(
+    json.dumps(ExtractedInvoiceContent.model_json_schema(), sort_keys=True).encode()
+).hexdigest()[:16]
+
+
 class ExtractedInvoiceWithData(ExtractedInvoiceContent):
     invoice_file_path: str = Field(description="The path to the invoice file")
+    run_stats: Optional[AgentRunStats] = Field(
+        default=None,
+        description="Steps, tokens and time the browser agent used; absent when the invoice came from the cache",
+    )
 
 
-def encode_pdf(pdf_path):
-    """Encode the pdf to base64."""
-    try:
-        with open(pdf_path, "rb") as pdf_file:
-            return base64.b64encode(pdf_file.read()).decode("utf-8")
-    except FileNotFoundError:
-        print(f"Error: The file {pdf_path} was not found.")
-        return None
-    except Exception as e:  # Added general exception handling
-        print(f"Error: {e}")
-        return None
+DOMAIN_OR_URL_DESCRIPTION = "The domain or url of the merchant or website that issued the invoice, e.g. 'example.com' without the 'https://' prefix"
+DOMAIN_OR_URL_PATTERN = r"^([a-zA-Z0-9-]+\.)+[a-zA-Z]{2,}(/.*)?$"
+
+
+class InvoiceRequest(BaseModel):
+    domainOrUrl: str = Field(
+        description=DOMAIN_OR_URL_DESCRIPTION, pattern=DOMAIN_OR_URL_PATTERN
+    )
+    date: datetime.date = Field(
+        description="The date of the transaction, in the format YYYY-MM-DD"
+    )
+    reference: str = Field(
+        description="The reference of the transaction, e.g. a transaction ID"
+    )
+    amount: float = Field(
+        description="The amount of the transaction, in the currency of the invoice"
+    )
+
+
+class InvoiceBatchItemResult(InvoiceRequest):
+    index: int = Field(description="Position of the transaction in the request")
+    status: Literal["succeeded", "failed"]
+    invoice: Optional[ExtractedInvoiceWithData] = None
+    error: Optional[str] = None
+
+
+class InvoiceBatchResponse(BaseModel):
+    """Per-transaction results of a batch invoice retrieval, in request order."""
+
+    results: List[InvoiceBatchItemResult]
+    succeeded: int
+    failed: int
 
 
-openai = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+class InvoiceJobRequest(InvoiceRequest):
+    force_refresh: bool = False
+
+
+class InvoiceJob(BaseModel):
+    """A background invoice retrieval and, once finished, its outcome."""
+
+    job_id: str
+    status: JobStatus
+    request: InvoiceJobRequest
+    invoice: Optional[ExtractedInvoiceWithData] = None
+    error: Optional[str] = None
+    created_at: datetime.datetime
+    started_at: Optional[datetime.datetime] = None
+    finished_at: Optional[datetime.datetime] = None
+
+
+class InvoiceJobListResponse(BaseModel):
+    jobs: List[InvoiceJob]
+    count: int
+
+
+class InvoiceMatchRequest(BaseModel):
+    invoice_date: datetime.date = Field(
+        description="The date of the invoice, in the format YYYY-MM-DD"
+    )
+    invoice_amount: float = Field(description="The amount of the invoice")
+    invoice_number: Optional[str] = Field(
+        default=None, description="The number of the invoice"
+    )
+    counterparty: Optional[str] = Field(
+        default=None,
+        description="The vendor that issued the invoice, as a name or domain",
+    )
+
+
+class TransactionMatch(BaseModel):
+    transaction_id: str
+    date: Optional[str] = None
+    amount: Optional[float] = None
+    reference: Optional[str] = None
+    counterparty: Optional[str] = None
+    description: Optional[str] = None
+    score: float = Field(description="Overall match score between 0 and 1")
+    date_diff_days: int = Field(
+        description="Transaction date minus invoice date, in days"
+    )
+    amount_diff_ratio: float = Field(
+        description="Absolute amount difference relative to the invoice amount"
+    )
+    reference_similarity: float
+    counterparty_similarity: float
+
+
+class InvoiceMatchResult(BaseModel):
+    index: int = Field(description="Position of the invoice in the request")
+    invoice_number: Optional[str] = None
+    match: Optional[TransactionMatch] = None
+    candidates: List[TransactionMatch] = Field(
+        description="Best-scoring transactions within the tolerances, best first"
+    )
+
+
+class InvoiceMatchResponse(BaseModel):
+    results: List[InvoiceMatchResult]
+    matched: int
+    unmatched: int
+
+
+class TransactionExportResponse(BaseModel):
+    file_path: str = Field(description="Local path of the exported file")
+    format: ExportFormat
+    row_count: int
+    columns: List[str]
+
+
+class RecurringChargeResponse(BaseModel):
+    counterparty: str = Field(
+        description="Counterparty as written on the latest charge"
+    )
+    currency: Optional[str] = None
+    cadence: Literal["weekly", "biweekly", "monthly", "quarterly", "yearly"]
+    interval_days: float = Field(description="Median days between charges")
+    regularity: float = Field(
+        description="Share of intervals between charges that match the cadence"
+    )
+    occurrences: int
+    first_date: str
+    last_date: str
+    next_expected_date: str
+    average_amount: float
+    last_amount: float
+    amount_variation: float = Field(
+        description="Standard deviation of the amounts relative to their mean"
+    )
+    total_amount: float
+    active: bool = Field(
+        description="Whether the latest charge is recent enough for the cadence to still be running"
+    )
+
+
+class RecurringChargesResponse(BaseModel):
+    charges: List[RecurringChargeResponse]
+    count: int
+
+
+@functools.cache
+def mistral_client() -> "Mistral":
+    # Imported on first OCR call; query-only servers never need the SDK
+    from mistralai import Mistral
+
+    return Mistral(api_key=os.getenv("MISTRAL_API_KEY"))
 
-mistral = Mistral(api_key=os.getenv("MISTRAL_API_KEY"))
 
 # Initialize database manager
 try:
@@ -82,6 +335,55 @@ def transaction_to_response(transaction: Transaction) -> TransactionResponse:
         created_at=transaction.created_at.isoformat()
         if transaction.created_at
         else None,
+        invoice_number=transaction.invoice_number,
+        invoice_file_path=transaction.invoice_file_path,
+    )
+
+
+def transactions_data_version(session) -> str:
+    """Changes whenever transactions are loaded, removed or marked invalid, for
+    caching derived results.
+
+    Besides the row count and the latest load time it sums the amounts, overall
+    and of the invalid rows, so a reload that replaces rows without changing
+    their number, or a change of invalid flags, also gives a new version.
+    """
+    invalid = Transaction.is_invalid == True
+    row = session.execute(
+        select(
+            func.count(),
+            func.max(Transaction.created_at),
+            func.sum(Transaction.amount),
+            func.max(Transaction.date),
+            func.count(case((invalid, 1))),
+            func.sum(case((invalid, Transaction.amount))),
+        )
+    ).one()
+    return ":".join("" if value is None else str(value) for value in row)
+
+
+def transaction_list_result(rows, shape: ResponseShape = "rows", **extra) -> ToolResult:
+    """Serialise selected transaction rows in bulk into a TransactionListResponse payload."""
+    transactions = transaction_rows_adapter.dump_python(
+        transaction_rows_adapter.validate_python(rows), mode="json"
+    )
+    if shape == "columns":
+        names = transactions[0].keys() if transactions else ()
+        payload = {
+            "columns": {
+                name: [transaction[name] for transaction in transactions]
+                for name in names
+            },
+            "count": len(transactions),
+            **extra,
+        }
+    else:
+        payload = {"transactions": transactions, "count": len(transactions), **extra}
+    return ToolResult(
+        content=[
+            TextContent(type="text", text=pydantic_core.to_json(payload).decode())
+        ],
+        structured_content=payload,
     )
 
 
@@ -90,9 +392,326 @@ mcp = FastMCP(
     instructions="""
     This MCP server is used to download invoices from websites in a unified format and query transactions from the database.
     """,
-    port=8001,
+    port=MCP_PORT,
+)
+mcp.add_middleware(ToolMetricsMiddleware())
+
+
+def invoice_domain(domainOrUrl: str) -> str:
+    """Normalise a domain or url to the host that per-domain limits are keyed on."""
+    return domainOrUrl.split("/", 1)[0].lower().removeprefix("www.")
+
+
+def concurrency_limit(name: str, value: int):
+    """A semaphore for this process, or for all worker processes in multi-worker mode."""
+    if MCP_WORKERS > 1:
+        return SharedSemaphore(LOCK_DIR, name, value)
+    return asyncio.Semaphore(value)
+
+
+# Concurrency limits shared by every invoice retrieval, single or batched. The
+# per-domain limit keeps agents from fighting over the same merchant account.
+invoice_agent_slots = concurrency_limit("invoice-agents", MAX_CONCURRENT_AGENTS)
+
+
+@functools.cache
+def invoice_domain_slots(domain: str):
+    return concurrency_limit(f"domain-{lock_name(domain)}", MAX_AGENTS_PER_DOMAIN)
+
+
+# Results of past retrievals, so a repeated transaction skips the agent and OCR
+invoice_cache = InvoiceResultCache(
+    Path(os.getenv("INVOICE_CACHE_PATH", CACHE_DIR / "invoices.sqlite3")).expanduser()
+)
+
+# Parsed OCR annotations by PDF content, evicted least recently used first
+ocr_cache = OcrCache(
+    Path(os.getenv("OCR_CACHE_DIR", CACHE_DIR / "ocr")).expanduser(),
+    max_bytes=int(os.getenv("OCR_CACHE_MAX_MB", "256")) * 1024 * 1024,
+)
+
+# Recurring charges per set of parameters, until transactions change
+recurring_charges_cache = (
+    SharedVersionedCache(CACHE_DIR / "results.sqlite3")
+    if MCP_WORKERS > 1
+    else VersionedCache()
 )
 
+# How the agent last reached an invoice on each domain, replayed on later runs
+navigation_recipes = NavigationRecipeCache(
+    Path(
+        os.getenv("NAVIGATION_CACHE_PATH", CACHE_DIR / "navigation.sqlite3")
+    ).expanduser()
+)
+
+# Used until a run on the domain has recorded its own path
+DEFAULT_NAVIGATION_PATHS = {"fly.io": ["https://fly.io/dashboard/rentr/"]}
+
+# Warm browsers leased to invoice agents; at most one per concurrent agent. Leases
+# are bounded across workers by invoice_agent_slots, and each worker keeps only
+# its share of the idle browsers warm (see serve_worker).
+browser_pool = BrowserPool(
+    browser_profile,
+    max_size=MAX_CONCURRENT_AGENTS,
+    min_idle=BROWSER_POOL_MIN_IDLE,
+    idle_timeout=BROWSER_POOL_IDLE_TIMEOUT,
+    setup=block_resources,
+)
+
+
+def db_pools():
+    """Connection pools of the primary and the replicas, once their engines exist."""
+    pools = db_manager.pools() if db_manager else {}
+    # Only queue pools (the default for server databases) track their connections
+    return {
+        database: pool
+        for database, pool in pools.items()
+        if hasattr(pool, "checkedout")
+    }
+
+
+def db_pool_connections() -> dict[tuple[str, ...], Optional[float]]:
+    connections = {}
+    for database, pool in db_pools().items():
+        connections[(database, "checked_out")] = pool.checkedout()
+        connections[(database, "idle")] = pool.checkedin()
+        connections[(database, "overflow")] = max(pool.overflow(), 0)
+    return connections
+
+
+Gauge(
+    "db_pool_connections",
+    "Database connections in the pool by database and state.",
+    db_pool_connections,
+    labels=["database", "state"],
+)
+Gauge(
+    "db_pool_size",
+    "Configured size of the database connection pool.",
+    lambda: {(database,): pool.size() for database, pool in db_pools().items()},
+    labels=["database"],
+)
+Gauge(
+    "browser_pool_sessions",
+    "Pooled browser sessions by state.",
+    lambda: {("leased",): browser_pool.leased, ("idle",): browser_pool.idle},
+    labels=["state"],
+)
+Gauge(
+    "browser_pool_max_size",
+    "Maximum number of pooled browser sessions.",
+    lambda: {(): browser_pool.max_size},
+    # Every worker has the same cap, and invoice_agent_slots keeps all of
+    # them together within it
+    aggregate="max",
+)
+# With several workers a scrape reaches one of them, which reports the metrics
+# of all of them
+shared_metrics = SharedMetrics(METRICS_DIR) if MCP_WORKERS > 1 else None
+
+
+async def retrieve_invoice(
+    *,
+    domainOrUrl: str,
+    date: datetime.date,
+    reference: str,
+    amount: float,
+    force_refresh: bool = False,
+) -> ExtractedInvoiceWithData:
+    """Return the cached invoice for a transaction, or run the browser agent and OCR
+    for it within the concurrency limits."""
+    transaction = dict(
+        domain=invoice_domain(domainOrUrl),
+        reference=reference,
+        date=date,
+        amount=amount,
+    )
+    if not force_refresh:
+        invoice = cached_invoice(**transaction)
+        record_cache_lookup("invoice", invoice is not None)
+        if invoice:
+            return invoice
+
+    async with invoice_domain_slots(transaction["domain"]), invoice_agent_slots:
+        # A concurrent request for the same transaction may have finished meanwhile
+        if not force_refresh and (invoice := cached_invoice(**transaction)):
+            return invoice
+
+        invoice = await _retrieve_invoice(
+            domainOrUrl=domainOrUrl, date=date, reference=reference, amount=amount
+        )
+
+    invoice_cache.put(
+        **transaction,
+        invoice_file_path=invoice.invoice_file_path,
+        content=invoice.model_dump_json(exclude={"invoice_file_path", "run_stats"}),
+    )
+    return invoice
+
+
+def cached_invoice(**transaction) -> Optional[ExtractedInvoiceWithData]:
+    cached = invoice_cache.get(**transaction)
+    if not cached:
+        return None
+
+    logger.info(f"Invoice cache hit for {transaction['reference']}")
+    content = ExtractedInvoiceContent.model_validate_json(cached.content)
+    return ExtractedInvoiceWithData(
+        invoice_file_path=cached.invoice_file_path, **content.model_dump()
+    )
+
+
+async def _retrieve_invoice(
+    *,
+    domainOrUrl: str,
+    date: datetime.date,
+    reference: str,
+    amount: float,
+) -> ExtractedInvoiceWithData:
+    domain = invoice_domain(domainOrUrl)
+    recipe = navigation_recipes.get(domain)
+    record_cache_lookup("navigation", recipe is not None)
+    known_path = recipe.urls if recipe else DEFAULT_NAVIGATION_PATHS.get(domain)
+
+    # Each retrieval downloads into its own directory so parallel agents
+    # never see each other's files
+    DOWNLOADS_DIR.mkdir(parents=True, exist_ok=True)
+    downloads_path = Path(tempfile.mkdtemp(prefix=f"{domain}-", dir=DOWNLOADS_DIR))
+
+    # Hold the pooled browser only while the agent runs, not during OCR
+    async with browser_pool.lease(downloads_path) as browser_session:
+        agent = await create_agent(
+            domainOrUrl=domainOrUrl,
+            tx_date=date,
+            tx_amount=amount,
+            tx_reference=reference,
+            browser_session=browser_session,
+            known_path=known_path,
+        )
+        try:
+            run = await run_agent(agent, downloads_path=downloads_path)
+            history = run.history
+            result = history.final_result()
+            logger.info(f"Agent run finished: {run.stats}")
+
+            if run.downloaded_file_path:
+                pdf_file_path = run.downloaded_file_path
+            elif result:
+                parsed: Result = Result.model_validate_json(result)
+                if parsed.downloaded_file_path and len(parsed.downloaded_file_path) > 0:
+                    pdf_file_path = parsed.downloaded_file_path
+                else:
+                    raise ValueError("No invoice found by agent")
+            elif run.stats.stop_reason != "done":
+                raise ValueError(
+                    f"Agent stopped without an invoice ({run.stats.stop_reason})"
+                )
+            else:
+                raise ValueError("No invoice result found in agent history")
+        except Exception:
+            if recipe:
+                navigation_recipes.record_failure(domain)
+            # Keep partial downloads of failed runs for inspection
+            with contextlib.suppress(OSError):
+                downloads_path.rmdir()
+            raise
+
+    if path := navigation_path(history, domain):
+        navigation_recipes.record_success(domain, urls=path)
+
+    logger.info(f"Got Invoice PDF file path: {pdf_file_path}")
+
+    content = await extract_invoice_content(pdf_file_path, domain=domain)
+
+    return ExtractedInvoiceWithData(
+        invoice_file_path=pdf_file_path,
+        run_stats=run.stats,
+        **content.model_dump(),
+    )
+
+
+async def ocr_pdf(pdf_file_path: str) -> "OCRResponse":
+    """Run Mistral OCR on a PDF uploaded through the files API.
+
+    The file is streamed from disk in the upload request instead of being
+    inlined as a base64 data URL, and deleted from Mistral once processed.
+    """
+    from mistralai.extra import response_format_from_pydantic_model
+
+    mistral = mistral_client()
+    with open(pdf_file_path, "rb") as pdf_file:
+        uploaded = await mistral.files.upload_async(
+            file={"file_name": Path(pdf_file_path).name, "content": pdf_file},
+            purpose="ocr",
+        )
+    logger.info(f"Uploaded PDF for OCR: {uploaded.id}")
+
+    try:
+        signed_url = await mistral.files.get_signed_url_async(file_id=uploaded.id)
+        return await mistral.ocr.process_async(
+            model="mistral-ocr-latest",
+            document={"type": "document_url", "document_url": signed_url.url},
+            document_annotation_format=response_format_from_pydantic_model(
+                ExtractedInvoiceContent
+            ),
+            include_image_base64=OCR_INCLUDE_IMAGE_BASE64,
+            timeout_ms=30000,
+        )
+    finally:
+        try:
+            await mistral.files.delete_async(file_id=uploaded.id)
+        except Exception as e:
+            logger.warning(f"Failed to delete uploaded OCR file {uploaded.id}: {e}")
+
+
+async def extract_invoice_content(
+    pdf_file_path: str, domain: Optional[str] = None
+) -> ExtractedInvoiceContent:
+    """Extract the invoice fields from a PDF.
+
+    Text-based PDFs are parsed locally with the patterns for `domain`; Mistral
+    OCR is only called when that extraction is incomplete or uncertain. OCR
+    results are cached by the SHA-256 of the file, so the same PDF (or a
+    byte-identical re-download) is only sent to OCR once per schema version.
+    """
+    digest = file_sha256(pdf_file_path)
+    cached = ocr_cache.get(digest, OCR_SCHEMA_VERSION)
+    record_cache_lookup("ocr", cached is not None)
+    if cached:
+        logger.info(f"OCR cache hit for {pdf_file_path}")
+        return ExtractedInvoiceContent.model_validate_json(cached)
+
+    local = await asyncio.to_thread(
+        extract_invoice_fields_from_pdf, pdf_file_path, domain
+    )
+    if local.confidence >= LOCAL_EXTRACTION_MIN_CONFIDENCE:
+        try:
+            content = ExtractedInvoiceContent.model_validate(local.fields)
+        except ValidationError as e:
+            logger.info(f"Discarding local extraction for {pdf_file_path}: {e}")
+        else:
+            logger.info(f"Extracted invoice content locally: {content}")
+            return content
+    else:
+        logger.info(
+            f"Local extraction confidence {local.confidence:.2f} too low, using OCR"
+        )
+
+    with OCR_DURATION.time():
+        response = await ocr_pdf(pdf_file_path)
+
+    logger.info(f"Got Mistral OCR response: {response.document_annotation}")
+
+    if response.document_annotation:
+        content = ExtractedInvoiceContent.model_validate_json(
+            response.document_annotation
+        )
+    else:
+        raise ValueError("No invoice content found in Mistral OCR response")
+
+    ocr_cache.put(digest, OCR_SCHEMA_VERSION, content.model_dump_json())
+    return content
+
 
 @mcp.tool(
     name="find_and_download_invoice",
@@ -103,8 +722,8 @@ async def find_and_download_invoice(
     domainOrUrl: Annotated[
         str,
         Field(
-            description="The domain or url of the merchant or website that issued the invoice, e.g. 'example.com' without the 'https://' prefix",
-            pattern=r"^([a-zA-Z0-9-]+\.)+[a-zA-Z]{2,}(/.*)?$",
+            description=DOMAIN_OR_URL_DESCRIPTION,
+            pattern=DOMAIN_OR_URL_PATTERN,
         ),
     ],
     date: Annotated[
@@ -121,59 +740,204 @@ async def find_and_download_invoice(
             description="The amount of the transaction, in the currency of the invoice"
         ),
     ],
+    force_refresh: Annotated[
+        bool,
+        Field(
+            description="Ignore any cached invoice for this transaction and retrieve it again"
+        ),
+    ] = False,
 ) -> ExtractedInvoiceWithData:
-    agent = await create_agent(
+    return await retrieve_invoice(
         domainOrUrl=domainOrUrl,
-        tx_date=date,
-        tx_amount=amount,
-        tx_reference=reference,
+        date=date,
+        reference=reference,
+        amount=amount,
+        force_refresh=force_refresh,
     )
-    history = await agent.run()
 
-    result = history.final_result()
 
-    if result:
-        parsed: Result = Result.model_validate_json(result)
-        if parsed.downloaded_file_path and len(parsed.downloaded_file_path) > 0:
-            pdf_file_path = parsed.downloaded_file_path
-        else:
-            raise ValueError("No invoice found by agent")
-    else:
-        raise ValueError("No invoice result found in agent history")
+@mcp.tool(
+    name="find_and_download_invoices",
+    description="Find and download invoices for many transactions at once. Transactions are retrieved in parallel, grouped by domain, and each result is streamed back as a log message when it completes. Failed items do not fail the batch.",
+    output_schema=InvoiceBatchResponse.model_json_schema(),
+)
+async def find_and_download_invoices(
+    invoices: Annotated[
+        List[InvoiceRequest],
+        Field(description="The transactions to retrieve invoices for", min_length=1),
+    ],
+    ctx: Context,
+    force_refresh: Annotated[
+        bool,
+        Field(
+            description="Ignore cached invoices for these transactions and retrieve them again"
+        ),
+    ] = False,
+) -> InvoiceBatchResponse:
+    by_domain: dict[str, list[int]] = defaultdict(list)
+    for index, request in enumerate(invoices):
+        by_domain[invoice_domain(request.domainOrUrl)].append(index)
 
-    logger.info(f"Got Invoice PDF file path: {pdf_file_path}")
+    async def retrieve(index: int) -> InvoiceBatchItemResult:
+        request = invoices[index]
+        try:
+            invoice = await retrieve_invoice(
+                **request.model_dump(), force_refresh=force_refresh
+            )
+        except Exception as e:
+            logger.warning(f"Invoice retrieval failed for {request.reference}: {e}")
+            return InvoiceBatchItemResult(
+                index=index, **request.model_dump(), status="failed", error=str(e)
+            )
+        return InvoiceBatchItemResult(
+            index=index, **request.model_dump(), status="succeeded", invoice=invoice
+        )
 
-    # Extract text from PDF
-    pdf_encoded = encode_pdf(pdf_file_path)
+    # Queue each domain's transactions together so they share that domain's slots
+    tasks = [
+        asyncio.ensure_future(retrieve(index))
+        for indices in by_domain.values()
+        for index in indices
+    ]
 
-    logger.info("Got PDF encoded")
+    results: list[InvoiceBatchItemResult] = []
+    try:
+        for completed in asyncio.as_completed(tasks):
+            item = await completed
+            results.append(item)
+            await ctx.log(
+                item.model_dump_json(),
+                level="info",
+                logger_name="find_and_download_invoices",
+            )
+            await ctx.report_progress(
+                len(results),
+                len(tasks),
+                message=f"{item.reference}: {item.status}",
+            )
+    finally:
+        for task in tasks:
+            task.cancel()
 
-    response = await mistral.ocr.process_async(
-        model="mistral-ocr-latest",
-        document={
-            "type": "document_url",
-            "document_url": f"data:application/pdf;base64,{pdf_encoded}",
-        },
-        document_annotation_format=response_format_from_pydantic_model(
-            ExtractedInvoiceContent
-        ),
-        include_image_base64=True,
-        timeout_ms=30000,
+    results.sort(key=lambda item: item.index)
+    succeeded = sum(item.status == "succeeded" for item in results)
+
+    return InvoiceBatchResponse(
+        results=results, succeeded=succeeded, failed=len(results) - succeeded
     )
 
-    logger.info(f"Got Mistral OCR response: {response.document_annotation}")
 
-    if response.document_annotation:
-        content = ExtractedInvoiceContent.model_validate_json(
-            response.document_annotation
-        )
-    else:
-        raise ValueError("No invoice content found in Mistral OCR response")
+async def run_invoice_job(request: str) -> str:
+    job_request = InvoiceJobRequest.model_validate_json(request)
+    invoice = await retrieve_invoice(**job_request.model_dump())
+    return invoice.model_dump_json()
 
-    return ExtractedInvoiceWithData(
-        invoice_file_path=pdf_file_path,
-        **content.model_dump(),
+
+# Background invoice retrievals, persisted so queued jobs survive restarts
+invoice_jobs = JobQueue(
+    JobStore(
+        Path(os.getenv("INVOICE_JOBS_PATH", CACHE_DIR / "jobs.sqlite3")).expanduser()
+    ),
+    run_invoice_job,
+    workers=INVOICE_JOB_WORKERS,
+)
+
+
+def invoice_job_response(job: JobRecord) -> InvoiceJob:
+    return InvoiceJob(
+        job_id=job.job_id,
+        status=job.status,
+        request=InvoiceJobRequest.model_validate_json(job.request),
+        invoice=ExtractedInvoiceWithData.model_validate_json(job.result)
+        if job.result
+        else None,
+        error=job.error,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+    )
+
+
+@mcp.tool(
+    name="submit_invoice_job",
+    description="Start finding and downloading an invoice in the background and return a job ID immediately. Poll get_invoice_job with the ID for the result.",
+    output_schema=InvoiceJob.model_json_schema(),
+)
+async def submit_invoice_job(
+    domainOrUrl: Annotated[
+        str,
+        Field(
+            description=DOMAIN_OR_URL_DESCRIPTION,
+            pattern=DOMAIN_OR_URL_PATTERN,
+        ),
+    ],
+    date: Annotated[
+        datetime.date,
+        Field(description="The date of the transaction, in the format YYYY-MM-DD"),
+    ],
+    reference: Annotated[
+        str,
+        Field(description="The reference of the transaction, e.g. a transaction ID"),
+    ],
+    amount: Annotated[
+        float,
+        Field(
+            description="The amount of the transaction, in the currency of the invoice"
+        ),
+    ],
+    force_refresh: Annotated[
+        bool,
+        Field(
+            description="Ignore any cached invoice for this transaction and retrieve it again"
+        ),
+    ] = False,
+) -> InvoiceJob:
+    request = InvoiceJobRequest(
+        domainOrUrl=domainOrUrl,
+        date=date,
+        reference=reference,
+        amount=amount,
+        force_refresh=force_refresh,
     )
+    job = invoice_jobs.submit(request.model_dump_json())
+    return invoice_job_response(job)
+
+
+@mcp.tool(
+    name="get_invoice_job",
+    description="Get the status of a background invoice job and, once it has succeeded, the invoice.",
+    output_schema=InvoiceJob.model_json_schema(),
+)
+async def get_invoice_job(
+    job_id: Annotated[
+        str, Field(description="The job ID returned by submit_invoice_job")
+    ],
+) -> InvoiceJob:
+    job = invoice_jobs.store.get(job_id)
+    if not job:
+        raise ValueError(f"Invoice job {job_id} not found")
+    return invoice_job_response(job)
+
+
+@mcp.tool(
+    name="list_invoice_jobs",
+    description="List background invoice jobs, most recent first",
+    output_schema=InvoiceJobListResponse.model_json_schema(),
+)
+async def list_invoice_jobs(
+    status: Annotated[
+        Optional[JobStatus],
+        Field(description="Only return jobs with this status"),
+    ] = None,
+    limit: Annotated[
+        int, Field(description="Maximum number of jobs to return", ge=1)
+    ] = 50,
+) -> InvoiceJobListResponse:
+    jobs = [
+        invoice_job_response(job)
+        for job in invoice_jobs.store.recent(status=status, limit=limit)
+    ]
+    return InvoiceJobListResponse(jobs=jobs, count=len(jobs))
 
 
 @mcp.tool(
@@ -185,99 +949,316 @@ async def get_transactions(
     limit: Annotated[
         int, Field(description="Maximum number of transactions to return", default=100)
     ] = 100,
-) -> TransactionListResponse:
+    fields: Annotated[
+        Optional[List[TransactionField]],
+        Field(
+            description="Only return these transaction fields (transaction_id is always included). Returns all fields if omitted."
+        ),
+    ] = None,
+    shape: Annotated[
+        ResponseShape,
+        Field(
+            description="'rows' for one object per transaction, 'columns' for one list of values per field (smaller for large pages)"
+        ),
+    ] = "rows",
+) -> ToolResult:
     if not db_manager:
         raise ValueError(
             "Database not configured. Please set DATABASE_URL environment variable."
         )
 
-    session = db_manager.get_session()
+    session = db_manager.get_read_session()
     try:
-        query = session.query(Transaction)
+        # Select plain Core rows for the requested columns only, skipping ORM
+        # entity construction and the identity map
+        # Ordered to match idx_transactions_date_desc_id, so the newest rows are
+        # read straight from the index without a sort
+        query = (
+            select(*transaction_columns(fields))
+            .order_by(Transaction.date.desc(), Transaction.transaction_id)
+            .limit(limit)
+        )
 
-        # Order by date descending and apply limit
-        query = query.order_by(Transaction.date.desc()).limit(limit)
+        rows = session.execute(query).mappings().all()
+
+        return transaction_list_result(rows, shape)
+    finally:
+        session.close()
 
-        transactions = query.all()
-        transaction_responses = [transaction_to_response(t) for t in transactions]
 
-        return TransactionListResponse(
-            transactions=transaction_responses, count=len(transaction_responses)
+@mcp.tool(
+    name="export_transactions",
+    description="Export transactions matching the filters to a local CSV, NDJSON or Parquet file, newest first, and return its path and row count. Use this instead of get_transactions for bulk extraction: rows are written to disk, not returned.",
+    output_schema=TransactionExportResponse.model_json_schema(),
+)
+async def export_transactions(
+    format: Annotated[
+        ExportFormat, Field(description="File format: csv, ndjson or parquet")
+    ] = "csv",
+    fields: Annotated[
+        Optional[List[TransactionField]],
+        Field(
+            description="Only export these transaction fields (transaction_id is always included). Exports all fields if omitted."
+        ),
+    ] = None,
+    category: Annotated[
+        Optional[str], Field(description="Filter by transaction category")
+    ] = None,
+    provider: Annotated[Optional[str], Field(description="Filter by provider")] = None,
+    start_date: Annotated[
+        Optional[datetime.date], Field(description="Start date filter (YYYY-MM-DD)")
+    ] = None,
+    end_date: Annotated[
+        Optional[datetime.date], Field(description="End date filter (YYYY-MM-DD)")
+    ] = None,
+    include_invalid: Annotated[
+        bool, Field(description="Also export transactions marked invalid")
+    ] = False,
+) -> TransactionExportResponse:
+    if not db_manager:
+        raise ValueError(
+            "Database not configured. Please set DATABASE_URL environment variable."
         )
+
+    columns = transaction_columns(fields)
+    query = select(*columns).order_by(
+        Transaction.date.desc(), Transaction.transaction_id
+    )
+    if not include_invalid:
+        query = query.where(Transaction.is_invalid.is_not(True))
+    if category:
+        query = query.where(Transaction.category == category)
+    if provider:
+        query = query.where(Transaction.provider == provider)
+    if start_date:
+        query = query.where(Transaction.date >= start_date)
+    if end_date:
+        query = query.where(Transaction.date <= end_date)
+
+    path = export_path(format)
+    row_count = await asyncio.to_thread(
+        stream_export,
+        query,
+        {column.name: column.type.python_type for column in columns},
+        path,
+        format,
+    )
+    logger.info(f"Exported {row_count} transactions to {path}")
+    return TransactionExportResponse(
+        file_path=str(path),
+        format=format,
+        row_count=row_count,
+        columns=[column.name for column in columns],
+    )
+
+
+def stream_export(query, columns: dict[str, type], path: Path, format) -> int:
+    """Fetch the query's rows in batches through a server-side cursor and write
+    each batch out before fetching the next."""
+    session = db_manager.get_read_session()
+    try:
+        result = session.execute(
+            query.execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE)
+        )
+        return write_export(result.partitions(), columns, path, format)
+    finally:
+        session.close()
+
+
+@mcp.tool(
+    name="get_transactions_by_ids",
+    description="Get many transactions by their IDs in one query",
+    output_schema=TransactionLookupResponse.model_json_schema(),
+)
+async def get_transactions_by_ids(
+    transaction_ids: Annotated[
+        List[str],
+        Field(
+            description="The transaction IDs to fetch", min_length=1, max_length=10000
+        ),
+    ],
+    fields: Annotated[
+        Optional[List[TransactionField]],
+        Field(
+            description="Only return these transaction fields (transaction_id is always included). Returns all fields if omitted."
+        ),
+    ] = None,
+    shape: Annotated[
+        ResponseShape,
+        Field(
+            description="'rows' for one object per transaction, 'columns' for one list of values per field (smaller for large pages)"
+        ),
+    ] = "rows",
+) -> ToolResult:
+    if not db_manager:
+        raise ValueError(
+            "Database not configured. Please set DATABASE_URL environment variable."
+        )
+
+    ids = list(dict.fromkeys(transaction_ids))
+    session = db_manager.get_read_session()
+    try:
+        # One round trip for the whole list: transaction_id = ANY(:ids)
+        query = select(*transaction_columns(fields)).where(
+            Transaction.transaction_id
+            == any_(bindparam("ids", ids, type_=ARRAY(String)))
+        )
+        rows = {row["transaction_id"]: row for row in session.execute(query).mappings()}
     finally:
         session.close()
 
+    return transaction_list_result(
+        [rows[id] for id in ids if id in rows],
+        shape,
+        missing=[id for id in ids if id not in rows],
+    )
+
+
+@mcp.tool(
+    name="update_transactions",
+    description="Set the category, invalid flag or matched invoice (number and file path) of many transactions at once. Only the fields given for a transaction are changed; all changes are applied in a single database transaction.",
+    output_schema=TransactionUpdateResponse.model_json_schema(),
+)
+async def update_transactions(
+    updates: Annotated[
+        List[TransactionUpdate],
+        Field(description="Changes per transaction", min_length=1, max_length=10000),
+    ],
+) -> TransactionUpdateResponse:
+    if not db_manager:
+        raise ValueError(
+            "Database not configured. Please set DATABASE_URL environment variable."
+        )
+
+    # The last change wins when an ID is given more than once; updates that set
+    # the same fields are applied together as one UPDATE ... FROM (VALUES ...)
+    by_id = {change.transaction_id: change for change in updates}
+    batches: dict[tuple[str, ...], list[TransactionUpdate]] = defaultdict(list)
+    for change in by_id.values():
+        names = tuple(
+            sorted(name for name in change.model_fields_set if name != "transaction_id")
+        )
+        if names:
+            batches[names].append(change)
+
+    table = Transaction.__table__
+    updated: set[str] = set()
+    changed_dates: set[datetime.date] = set()
+    session = db_manager.get_session()
+    try:
+        for names, batch in batches.items():
+            changes = values(
+                column("transaction_id", String),
+                *(column(name, table.c[name].type) for name in names),
+                name="changes",
+            ).data(
+                [
+                    (change.transaction_id, *(getattr(change, name) for name in names))
+                    for change in batch
+                ]
+            )
+            statement = (
+                update(Transaction)
+                .where(Transaction.transaction_id == changes.c.transaction_id)
+                .values(
+                    {
+                        # NULLs in VALUES are untyped, so cast to the column type
+                        name: cast(changes.c[name], table.c[name].type)
+                        for name in names
+                    }
+                )
+                .returning(Transaction.transaction_id, Transaction.date)
+            )
+            for transaction_id, date in session.execute(statement):
+                updated.add(transaction_id)
+                # Category and the invalid flag are rollup keys
+                if {"category", "is_invalid"} & set(names):
+                    changed_dates.add(date)
+        refresh_daily_rollup(session, changed_dates)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+    # Derived results may depend on the categories and flags just changed
+    recurring_charges_cache.clear()
+    return TransactionUpdateResponse(
+        updated=len(updated),
+        missing=[id for id in by_id if id not in updated],
+    )
+
 
-# @mcp.tool(
-#     name="get_transaction_by_id",
-#     description="Get a specific transaction by its ID",
-#     output_schema=TransactionResponse.model_json_schema(),
-# )
-# async def get_transaction_by_id(
-#     transaction_id: Annotated[str, Field(description="The unique transaction ID")],
-# ) -> TransactionResponse:
-#     if not db_manager:
-#         raise ValueError(
-#             "Database not configured. Please set DATABASE_URL environment variable."
-#         )
-
-#     session = db_manager.get_session()
-#     try:
-#         transaction = (
-#             session.query(Transaction)
-#             .filter(Transaction.transaction_id == transaction_id)
-#             .first()
-#         )
-
-#         if not transaction:
-#             raise ValueError(f"Transaction with ID {transaction_id} not found")
-
-#         return transaction_to_response(transaction)
-#     finally:
-#         session.close()
-
-
-# @mcp.tool(
-#     name="search_transactions",
-#     description="Search transactions by description or counterparty name",
-#     output_schema=TransactionListResponse.model_json_schema(),
-# )
-# async def search_transactions(
-#     search_term: Annotated[
-#         str,
-#         Field(description="Search term to match against description or counterparty"),
-#     ],
-#     limit: Annotated[
-#         int, Field(description="Maximum number of transactions to return", default=50)
-#     ] = 50,
-# ) -> TransactionListResponse:
-#     if not db_manager:
-#         raise ValueError(
-#             "Database not configured. Please set DATABASE_URL environment variable."
-#         )
-
-#     session = db_manager.get_session()
-#     try:
-#         query = (
-#             session.query(Transaction)
-#             .filter(
-#                 or_(
-#                     Transaction.description.ilike(f"%{search_term}%"),
-#                     Transaction.counterparty.ilike(f"%{search_term}%"),
-#                 )
-#             )
-#             .order_by(Transaction.date.desc())
-#             .limit(limit)
-#         )
-
-#         transactions = query.all()
-#         transaction_responses = [transaction_to_response(t) for t in transactions]
-
-#         return TransactionListResponse(
-#             transactions=transaction_responses, count=len(transaction_responses)
-#         )
-#     finally:
-#         session.close()
+@mcp.tool(
+    name="search_transactions",
+    description="Search transactions by words in the description or counterparty, with fuzzy counterparty matching. Results are ranked by relevance.",
+    output_schema=TransactionSearchResponse.model_json_schema(),
+)
+async def search_transactions(
+    search_term: Annotated[
+        str,
+        Field(
+            description="Search term to match against description or counterparty",
+            min_length=1,
+        ),
+    ],
+    limit: Annotated[
+        int,
+        Field(description="Maximum number of transactions to return", ge=1, le=1000),
+    ] = 50,
+    offset: Annotated[
+        int,
+        Field(description="Number of ranked results to skip, for pagination", ge=0),
+    ] = 0,
+    fields: Annotated[
+        Optional[List[TransactionField]],
+        Field(
+            description="Only return these transaction fields (transaction_id is always included). Returns all fields if omitted."
+        ),
+    ] = None,
+    shape: Annotated[
+        ResponseShape,
+        Field(
+            description="'rows' for one object per transaction, 'columns' for one list of values per field (smaller for large pages)"
+        ),
+    ] = "rows",
+) -> ToolResult:
+    if not db_manager:
+        raise ValueError(
+            "Database not configured. Please set DATABASE_URL environment variable."
+        )
+
+    # Both predicates are served by GIN indexes: the tsvector expression index for
+    # word matches and the pg_trgm index on counterparty for fuzzy matches
+    ts_query = websearch_to_tsquery(SEARCH_CONFIG, search_term)
+    word_match = transaction_search_document.bool_op("@@")(ts_query)
+    fuzzy_match = Transaction.counterparty.bool_op("%")(search_term)
+    relevance = func.ts_rank_cd(transaction_search_document, ts_query) + func.coalesce(
+        func.similarity(Transaction.counterparty, search_term), 0
+    )
+
+    session = db_manager.get_read_session()
+    try:
+        # Fetch one extra row to know whether another page exists
+        query = (
+            select(*transaction_columns(fields))
+            .where(or_(word_match, fuzzy_match))
+            .order_by(
+                relevance.desc(), Transaction.date.desc(), Transaction.transaction_id
+            )
+            .offset(offset)
+            .limit(limit + 1)
+        )
+
+        rows = session.execute(query).mappings().all()
+        has_more = len(rows) > limit
+
+        return transaction_list_result(
+            rows[:limit], shape, next_offset=offset + limit if has_more else None
+        )
+    finally:
+        session.close()
 
 
 @mcp.tool(
@@ -302,45 +1283,92 @@ async def get_transaction_summary(
             "Database not configured. Please set DATABASE_URL environment variable."
         )
 
-    session = db_manager.get_session()
+    session = db_manager.get_read_session()
     try:
-        query = session.query(Transaction).filter(Transaction.is_invalid != True)
+        # Answered from the per-day rollup: one row per day and key combination
+        # rather than one per transaction
+        query = (
+            select(
+                daily_rollup.c.category,
+                daily_rollup.c.provider,
+                daily_rollup.c.currency,
+                func.sum(daily_rollup.c.transaction_count),
+                func.sum(daily_rollup.c.amount_sum),
+                func.min(daily_rollup.c.date),
+                func.max(daily_rollup.c.date),
+            )
+            .where(daily_rollup.c.is_invalid != True)
+            .group_by(
+                daily_rollup.c.category,
+                daily_rollup.c.provider,
+                daily_rollup.c.currency,
+            )
+        )
+
+        # The rollup has no row for transactions without a date; without a
+        # date filter they are counted from the transactions table
+        undated = (
+            select(
+                Transaction.category,
+                Transaction.provider,
+                Transaction.currency,
+                func.count(),
+                func.sum(Transaction.amount),
+                null(),
+                null(),
+            )
+            .where(Transaction.date.is_(None), Transaction.is_invalid != True)
+            .group_by(Transaction.category, Transaction.provider, Transaction.currency)
+        )
 
         # Apply filters
         if category:
-            query = query.filter(Transaction.category == category)
+            query = query.where(daily_rollup.c.category == category)
+            undated = undated.where(Transaction.category == category)
         if provider:
-            query = query.filter(Transaction.provider == provider)
+            query = query.where(daily_rollup.c.provider == provider)
+            undated = undated.where(Transaction.provider == provider)
         if start_date:
-            query = query.filter(Transaction.date >= start_date)
+            query = query.where(daily_rollup.c.date >= start_date)
         if end_date:
-            query = query.filter(Transaction.date <= end_date)
+            query = query.where(daily_rollup.c.date <= end_date)
+        if not start_date and not end_date:
+            query = union_all(query, undated)
 
-        transactions = query.all()
-
-        # Calculate summary statistics
-        total_count = len(transactions)
-        total_amount = sum(float(t.amount) if t.amount else 0 for t in transactions)
-
-        # Group by categories, providers, currencies
+        total_count = 0
+        total_amount = 0.0
         categories = {}
         providers = {}
         currencies = {}
-        dates = [t.date for t in transactions if t.date]
+        earliest = latest = None
 
-        for t in transactions:
-            if t.category:
-                categories[t.category] = categories.get(t.category, 0) + 1
-            if t.provider:
-                providers[t.provider] = providers.get(t.provider, 0) + 1
-            if t.currency:
-                currencies[t.currency] = currencies.get(t.currency, 0) + 1
+        for (
+            row_category,
+            row_provider,
+            row_currency,
+            count,
+            amount,
+            first,
+            last,
+        ) in session.execute(query):
+            count = int(count)
+            total_count += count
+            total_amount += float(amount or 0)
+            if row_category:
+                categories[row_category] = categories.get(row_category, 0) + count
+            if row_provider:
+                providers[row_provider] = providers.get(row_provider, 0) + count
+            if row_currency:
+                currencies[row_currency] = currencies.get(row_currency, 0) + count
+            if first is not None:
+                earliest = first if earliest is None else min(earliest, first)
+                latest = last if latest is None else max(latest, last)
 
         date_range = {}
-        if dates:
+        if earliest:
             date_range = {
-                "earliest": min(dates).isoformat(),
-                "latest": max(dates).isoformat(),
+                "earliest": earliest.isoformat(),
+                "latest": latest.isoformat(),
             }
 
         return TransactionSummaryResponse(
@@ -355,9 +1383,274 @@ async def get_transaction_summary(
         session.close()
 
 
+@mcp.tool(
+    name="match_invoices_to_transactions",
+    description="Match extracted invoices to bank transactions. Candidates are transactions within the date and amount tolerances, scored by date and amount closeness and by how well the invoice number and vendor match the transaction's reference and counterparty. Each transaction is matched to at most one invoice.",
+    output_schema=InvoiceMatchResponse.model_json_schema(),
+)
+async def match_invoices_to_transactions(
+    invoices: Annotated[
+        List[InvoiceMatchRequest],
+        Field(description="The invoices to match", min_length=1),
+    ],
+    date_tolerance_days: Annotated[
+        int,
+        Field(description="Maximum days between invoice and transaction date", ge=0),
+    ] = DEFAULT_DATE_TOLERANCE_DAYS,
+    amount_tolerance: Annotated[
+        float,
+        Field(
+            description="Maximum relative difference between invoice and transaction amount, e.g. 0.2 for 20%",
+            ge=0,
+        ),
+    ] = DEFAULT_AMOUNT_TOLERANCE,
+    max_candidates: Annotated[
+        int,
+        Field(description="Maximum candidates to return per invoice", ge=0),
+    ] = 3,
+) -> InvoiceMatchResponse:
+    if not db_manager:
+        raise ValueError(
+            "Database not configured. Please set DATABASE_URL environment variable."
+        )
+
+    window = datetime.timedelta(days=date_tolerance_days)
+    session = db_manager.get_read_session()
+    try:
+        # Only transactions that can fall into some invoice's date window
+        query = select(
+            Transaction.transaction_id,
+            Transaction.date,
+            Transaction.amount,
+            Transaction.reference,
+            Transaction.counterparty,
+            Transaction.description,
+        ).where(
+            Transaction.is_invalid.is_not(True),
+            Transaction.amount.is_not(None),
+            Transaction.date.between(
+                min(invoice.invoice_date for invoice in invoices) - window,
+                max(invoice.invoice_date for invoice in invoices) + window,
+            ),
+        )
+        rows = session.execute(query).mappings().all()
+    finally:
+        session.close()
+
+    index = TransactionIndex(rows)
+    candidates = index.candidates(
+        [InvoiceQuery(**invoice.model_dump()) for invoice in invoices],
+        date_tolerance_days=date_tolerance_days,
+        amount_tolerance=amount_tolerance,
+    )
+    matches = assign_matches(candidates)
+
+    top = candidates.top_per_invoice(max_candidates)
+    by_invoice: dict[int, list] = defaultdict(list)
+    for position, invoice_index in enumerate(top.invoice_index.tolist()):
+        by_invoice[invoice_index].append(position)
+
+    def transaction_match(found, position: int) -> TransactionMatch:
+        row = index.rows[found.transaction_index[position]]
+        return TransactionMatch(
+            transaction_id=row["transaction_id"],
+            date=row["date"].isoformat(),
+            amount=float(row["amount"]),
+            reference=row["reference"],
+            counterparty=row["counterparty"],
+            description=row["description"],
+            score=float(found.score[position]),
+            date_diff_days=int(found.date_diff_days[position]),
+            amount_diff_ratio=float(found.amount_diff_ratio[position]),
+            reference_similarity=float(found.reference_similarity[position]),
+            counterparty_similarity=float(found.counterparty_similarity[position]),
+        )
+
+    results = [
+        InvoiceMatchResult(
+            index=i,
+            invoice_number=invoice.invoice_number,
+            match=transaction_match(candidates, matches[i]) if i in matches else None,
+            candidates=[transaction_match(top, position) for position in by_invoice[i]],
+        )
+        for i, invoice in enumerate(invoices)
+    ]
+    return InvoiceMatchResponse(
+        results=results, matched=len(matches), unmatched=len(invoices) - len(matches)
+    )
+
+
+@mcp.tool(
+    name="detect_recurring_charges",
+    description="Find recurring charges and subscriptions across the full transaction history: outgoing payments to the same counterparty at a weekly, biweekly, monthly, quarterly or yearly cadence with stable amounts. Returns each one's cadence, amounts, last and next expected charge, largest total first.",
+    output_schema=RecurringChargesResponse.model_json_schema(),
+)
+async def detect_recurring_charges(
+    min_occurrences: Annotated[
+        int,
+        Field(description="Minimum number of charges to count as recurring", ge=2),
+    ] = DEFAULT_MIN_OCCURRENCES,
+    min_regularity: Annotated[
+        float,
+        Field(
+            description="Minimum share of intervals between charges that match the cadence",
+            ge=0,
+            le=1,
+        ),
+    ] = DEFAULT_MIN_REGULARITY,
+    max_amount_variation: Annotated[
+        float,
+        Field(
+            description="Maximum standard deviation of the amounts relative to their mean, e.g. 0.25 for 25%",
+            ge=0,
+        ),
+    ] = DEFAULT_MAX_AMOUNT_VARIATION,
+    active_only: Annotated[
+        bool, Field(description="Only return charges that are still running")
+    ] = False,
+) -> RecurringChargesResponse:
+    if not db_manager:
+        raise ValueError(
+            "Database not configured. Please set DATABASE_URL environment variable."
+        )
+
+    today = datetime.date.today()
+    key = (min_occurrences, min_regularity, max_amount_variation, active_only, today)
+    # Results are cached until the data version changes. update_transactions
+    # also clears the cache, so they are computed on the primary: a lagging
+    # replica could cache the rows from before an update again right after
+    session = db_manager.get_session()
+    try:
+        version = transactions_data_version(session)
+        cached = recurring_charges_cache.get(version, key)
+        record_cache_lookup("recurring_charges", cached is not None)
+        if cached:
+            return cached
+
+        query = select(
+            Transaction.date,
+            Transaction.amount,
+            Transaction.currency,
+            Transaction.counterparty,
+            Transaction.description,
+        ).where(Transaction.is_invalid.is_not(True), Transaction.amount < 0)
+        rows = session.execute(query).mappings().all()
+    finally:
+        session.close()
+
+    charges = []
+    for charge in find_recurring_charges(
+        rows,
+        min_occurrences=min_occurrences,
+        min_regularity=min_regularity,
+        max_amount_variation=max_amount_variation,
+    ):
+        # Overdue by more than half a period means the charge has stopped
+        active = (today - charge.next_expected_date).days <= charge.interval_days / 2
+        if active_only and not active:
+            continue
+        charges.append(
+            RecurringChargeResponse(
+                counterparty=charge.counterparty,
+                currency=charge.currency,
+                cadence=charge.cadence,
+                interval_days=charge.interval_days,
+                regularity=charge.regularity,
+                occurrences=charge.occurrences,
+                first_date=charge.first_date.isoformat(),
+                last_date=charge.last_date.isoformat(),
+                next_expected_date=charge.next_expected_date.isoformat(),
+                average_amount=charge.average_amount,
+                last_amount=charge.last_amount,
+                amount_variation=charge.amount_variation,
+                total_amount=charge.total_amount,
+                active=active,
+            )
+        )
+    charges.sort(key=lambda charge: charge.total_amount, reverse=True)
+
+    response = RecurringChargesResponse(charges=charges, count=len(charges))
+    recurring_charges_cache.put(version, key, response)
+    return response
+
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics(request: Request) -> PlainTextResponse:
+    """Prometheus scrape endpoint."""
+    if shared_metrics:
+        body = await asyncio.to_thread(shared_metrics.render)
+    else:
+        body = REGISTRY.render()
+    return PlainTextResponse(
+        body, media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+def http_middleware() -> list[Middleware]:
+    if HTTP_COMPRESSION_MIN_SIZE < 0:
+        return []
+    return [Middleware(CompressionMiddleware, minimum_size=HTTP_COMPRESSION_MIN_SIZE)]
+
+
 async def main():
-    await mcp.run_streamable_http_async()
+    # Pre-start browsers in the background so the first invoice skips cold start
+    asyncio.create_task(browser_pool.warm())
+    invoice_jobs.start()
+    try:
+        await mcp.run_http_async(transport="http", middleware=http_middleware())
+    finally:
+        await invoice_jobs.close()
+        await browser_pool.close()
+
+
+async def serve_worker(sock, index: int):
+    """Serve the MCP HTTP app on a socket shared with the other worker processes."""
+    browser_pool.min_idle = share(BROWSER_POOL_MIN_IDLE, MCP_WORKERS, index)
+    asyncio.create_task(browser_pool.warm())
+    metrics_writer = asyncio.create_task(shared_metrics.run())
+    # The supervisor requeues the jobs of workers that die; those still marked
+    # running may be running in another worker
+    invoice_jobs.start(requeue_interrupted=False)
+    # Requests of one client land on any worker, so no session state is kept
+    # between them
+    config = uvicorn.Config(
+        mcp.http_app(stateless_http=True, middleware=http_middleware()),
+        lifespan="on",
+        timeout_graceful_shutdown=0,
+        log_level=fastmcp.settings.log_level.lower(),
+    )
+    try:
+        await uvicorn.Server(config).serve(sockets=[sock])
+    finally:
+        await invoice_jobs.close()
+        await browser_pool.close()
+        metrics_writer.cancel()
+        shared_metrics.write()
+
+
+def run_worker(sock, index: int):
+    asyncio.run(serve_worker(sock, index))
+
+
+def requeue_worker_jobs(pid: int):
+    if requeued := invoice_jobs.store.requeue_interrupted(worker=str(pid)):
+        logger.info(f"Re-queued {requeued} jobs of worker {pid}")
+
+
+def run_workers():
+    invoice_jobs.store.requeue_interrupted()
+    shared_metrics.reset()
+    supervise(
+        run_worker,
+        host=fastmcp.settings.host,
+        port=MCP_PORT,
+        workers=MCP_WORKERS,
+        on_worker_exit=requeue_worker_jobs,
+    )
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if MCP_WORKERS > 1:
+        run_workers()
+    else:
+        asyncio.run(main())
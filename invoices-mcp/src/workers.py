@@ -0,0 +1,143 @@
+import asyncio
+import fcntl
+import hashlib
+import logging
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Waits between attempts to take a slot grow from the first to the second
+POLL_INTERVAL = (0.05, 1.0)
+
+
+class SharedSemaphore:
+    """Counting semaphore shared by every process on the host.
+
+    Each of the `value` slots is a lock file, and holding a slot means holding
+    an exclusive flock on it. The kernel drops the locks of a process when it
+    exits, so a crashed worker never leaks slots. Waiters poll, so unlike
+    asyncio.Semaphore it is not first-in, first-out.
+    """
+
+    def __init__(self, directory: Path, name: str, value: int):
+        if value < 1:
+            raise ValueError("value must be at least 1")
+        directory.mkdir(parents=True, exist_ok=True)
+        self.paths = [directory / f"{name}.{slot}.lock" for slot in range(value)]
+        self._held: list[int] = []  # file descriptors of the slots held
+
+    async def acquire(self) -> None:
+        delay, max_delay = POLL_INTERVAL
+        while (fd := self._try_acquire()) is None:
+            await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+            delay = min(delay * 2, max_delay)
+        self._held.append(fd)
+
+    def release(self) -> None:
+        fd = self._held.pop()
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+    async def __aenter__(self) -> None:
+        await self.acquire()
+
+    async def __aexit__(self, *exc) -> None:
+        self.release()
+
+    def _try_acquire(self) -> Optional[int]:
+        # Start at a random slot so processes do not all contend for the first
+        start = random.randrange(len(self.paths))
+        for path in self.paths[start:] + self.paths[:start]:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            return fd
+        return None
+
+
+def lock_name(key: str) -> str:
+    """File-name-safe name for a limit keyed by arbitrary text, such as a domain."""
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def share(total: int, workers: int, index: int) -> int:
+    """Worker `index`'s share of `total`, so the shares of all workers add up to it."""
+    return total // workers + (index < total % workers)
+
+
+def _run_worker(target: Callable[[socket.socket, int], None], sock, index: int):
+    # Let the supervisor handle Ctrl-C and forward it as SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    target(sock, index)
+
+
+def supervise(
+    target: Callable[[socket.socket, int], None],
+    *,
+    host: str,
+    port: int,
+    workers: int,
+    on_worker_exit: Optional[Callable[[int], None]] = None,
+) -> None:
+    """Serve one port from `workers` processes until interrupted.
+
+    The listening socket is bound here and inherited by every worker, which
+    calls `target(sock, index)`; the kernel spreads connections across them. A
+    worker that dies is replaced, after `on_worker_exit(pid)` has cleaned up
+    after it.
+    """
+    sock = socket.create_server((host, port), backlog=2048)
+    context = multiprocessing.get_context("spawn")
+
+    def start(index: int):
+        process = context.Process(
+            target=_run_worker, args=(target, sock, index), name=f"worker-{index}"
+        )
+        process.start()
+        return process
+
+    processes = {index: start(index) for index in range(workers)}
+    logger.info(f"Serving http://{host}:{port} from {workers} worker processes")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        while not stopping:
+            time.sleep(0.5)
+            for index, process in list(processes.items()):
+                if process.is_alive() or stopping:
+                    continue
+                logger.warning(
+                    f"Worker {index} (pid {process.pid}) exited with code {process.exitcode}; restarting it"
+                )
+                if on_worker_exit:
+                    on_worker_exit(process.pid)
+                processes[index] = start(index)
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join(timeout=30)
+            if process.is_alive():
+                process.kill()
+                process.join()
+        for process in processes.values():
+            if on_worker_exit and process.exitcode != 0:
+                on_worker_exit(process.pid)
+        sock.close()
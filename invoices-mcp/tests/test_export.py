@@ -0,0 +1,118 @@
+"""
+Tests for the transaction export files written by src/export.py. The Parquet
+test is skipped when pyarrow is not installed.
+
+    python -m pytest tests/   or   python tests/test_export.py
+"""
+
+import csv
+import datetime
+import json
+import sys
+import tempfile
+import unittest
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from export import write_export  # noqa: E402
+
+# Not representable as a float: float() would round it to 0.1
+AMOUNT = Decimal("0.1000000000000000055")
+
+COLUMNS = {
+    "transaction_id": str,
+    "date": datetime.date,
+    "amount": Decimal,
+    "is_invalid": bool,
+}
+ROWS = [
+    ("t1", datetime.date(2025, 7, 3), AMOUNT, False),
+    ("t2", datetime.date(2025, 7, 4), Decimal("-119.00"), True),
+]
+
+
+def export(format: str, rows=ROWS) -> Path:
+    path = Path(tempfile.mkdtemp()) / f"transactions.{format}"
+    # Two batches, as the server writes them
+    assert write_export([rows[:1], rows[1:]], COLUMNS, path, format) == len(rows)
+    return path
+
+
+def test_csv_keeps_exact_amounts():
+    with open(export("csv"), newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [Decimal(row["amount"]) for row in rows] == [AMOUNT, Decimal("-119.00")]
+    assert rows[0]["date"] == "2025-07-03"
+
+
+def test_ndjson_keeps_exact_amounts():
+    with open(export("ndjson")) as f:
+        rows = [json.loads(line) for line in f]
+    assert [Decimal(row["amount"]) for row in rows] == [AMOUNT, Decimal("-119.00")]
+    assert rows[0] == {
+        "transaction_id": "t1",
+        "date": "2025-07-03",
+        "amount": "0.1000000000000000055",
+        "is_invalid": False,
+    }
+
+
+def test_parquet_keeps_exact_amounts():
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise unittest.SkipTest("pyarrow is not installed") from None
+
+    # AMOUNT has more places than the Parquet scale, which is refused rather
+    # than rounded; this one fits the scale but not a float
+    amount = Decimal("12345678901234567.8901234567")
+    rows = [(*ROWS[0][:2], amount, False), ROWS[1]]
+    table = pq.read_table(export("parquet", rows))
+    assert table.column("amount").to_pylist() == [amount, Decimal("-119.00")]
+    assert table.column("date").to_pylist() == [row[1] for row in ROWS]
+
+    try:
+        export("parquet")
+    except ValueError as e:
+        assert "export as CSV or NDJSON" in str(e)
+    else:
+        raise AssertionError("AMOUNT was written to Parquet")
+
+
+def test_failed_export_leaves_no_file():
+    path = Path(tempfile.mkdtemp()) / "transactions.ndjson"
+
+    def batches():
+        yield ROWS
+        raise RuntimeError("database went away")
+
+    try:
+        write_export(batches(), COLUMNS, path, "ndjson")
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("the error was not raised")
+    assert list(path.parent.iterdir()) == []
+
+
+if __name__ == "__main__":
+    tests = [
+        (name, test)
+        for name, test in list(globals().items())
+        if name.startswith("test_") and callable(test)
+    ]
+    failed = 0
+    for name, test in tests:
+        try:
+            test()
+        except unittest.SkipTest as e:
+            print(f"⏭️  {name}: {e}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {name}: {e!r}")
+        else:
+            print(f"✅ {name}")
+    print(f"\n{len(tests) - failed}/{len(tests)} tests passed")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,197 @@
+"""
+Tests for the local invoice extraction in src/pdf_text.py and the decision in
+server.extract_invoice_content between its result and OCR.
+
+    python -m pytest tests/   or   python tests/test_pdf_text.py
+"""
+
+import asyncio
+import sys
+import tempfile
+import types
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from pdf_text import LocalExtraction, extract_invoice_fields  # noqa: E402
+
+STRIPE_INVOICE = """
+Invoice
+Invoice number 4F2A9C1B-0007
+Date of issue July 3, 2025
+Date due July 3, 2025
+Fly.io
+Description Qty Unit price Amount
+Usage 1 $100.00 $100.00
+Subtotal $100.00
+Total $119.00
+Amount due $119.00 USD
+"""
+
+GOOGLE_CLOUD_INVOICE = """
+Google Cloud
+Invoice number: 5193847261
+Invoice date: Jul 1, 2025
+Subtotal in EUR 100,00 €
+VAT (19%) 19,00 €
+Total amount due in EUR 119,00 €
+"""
+
+GENERIC_SUBTOTAL_INVOICE = """
+ACME Hosting Ltd
+Invoice No: INV-2025-0042
+Invoice date: 2025-07-03
+Subtotal $100.00
+Tax $19.00
+Total $119.00
+"""
+
+GENERIC_AMOUNT_DUE_INVOICE = """
+Invoice # INV-77881
+Date: 03.07.2025
+Sub total 100,00 EUR
+Total 119,00 EUR
+Payments -50,00 EUR
+Amount due 69,00 EUR
+"""
+
+GENERIC_NEXT_LINE_INVOICE = """
+Rechnungsnummer: RE-2025-118
+Rechnungsdatum: 03.07.2025
+Total: €119,00
+VAT 19% included
+"""
+
+
+def test_stripe_patterns():
+    result = extract_invoice_fields(STRIPE_INVOICE, "fly.io")
+    assert result.fields == {
+        "invoice_number": "4F2A9C1B-0007",
+        "invoice_date": "2025-07-03",
+        "invoice_amount": 119.0,
+        "invoice_currency": "USD",
+    }
+    assert result.confidence == 1.0
+
+
+def test_google_cloud_patterns():
+    result = extract_invoice_fields(GOOGLE_CLOUD_INVOICE, "cloud.google.com")
+    assert result.fields == {
+        "invoice_number": "5193847261",
+        "invoice_date": "2025-07-01",
+        "invoice_amount": 119.0,
+        "invoice_currency": "EUR",
+    }
+    assert result.confidence == 1.0
+
+
+def test_generic_total_is_not_subtotal():
+    result = extract_invoice_fields(GENERIC_SUBTOTAL_INVOICE, "acme-hosting.com")
+    assert result.fields == {
+        "invoice_number": "INV-2025-0042",
+        "invoice_date": "2025-07-03",
+        "invoice_amount": 119.0,
+        "invoice_currency": "USD",
+    }
+
+
+def test_generic_prefers_amount_due_over_total():
+    result = extract_invoice_fields(GENERIC_AMOUNT_DUE_INVOICE)
+    assert result.fields["invoice_amount"] == 69.0
+    assert result.fields["invoice_currency"] == "EUR"
+    assert result.fields["invoice_date"] == "2025-07-03"
+
+
+def test_generic_currency_does_not_cross_lines():
+    result = extract_invoice_fields(GENERIC_NEXT_LINE_INVOICE)
+    assert result.fields["invoice_amount"] == 119.0
+    assert result.fields["invoice_currency"] == "EUR"
+
+
+def test_symbol_wins_over_code():
+    result = extract_invoice_fields("Invoice No: INV-1234\nAmount due: €50.00 USD")
+    assert result.fields["invoice_currency"] == "EUR"
+
+
+def test_generic_confidence_is_below_default_threshold():
+    import server
+
+    complete = extract_invoice_fields(GENERIC_SUBTOTAL_INVOICE)
+    assert len(complete.fields) == 4
+    assert complete.confidence < server.LOCAL_EXTRACTION_MIN_CONFIDENCE
+    assert (
+        extract_invoice_fields(STRIPE_INVOICE, "fly.io").confidence
+        >= server.LOCAL_EXTRACTION_MIN_CONFIDENCE
+    )
+
+
+def extract_with(local: LocalExtraction) -> tuple[dict, bool]:
+    """Run server.extract_invoice_content on a PDF whose local extraction
+    returns `local`; returns the extracted fields and whether OCR was called."""
+    import server
+
+    ocr_calls = []
+
+    async def ocr_pdf(pdf_file_path):
+        ocr_calls.append(pdf_file_path)
+        return types.SimpleNamespace(
+            document_annotation='{"invoice_date": "2025-07-03", "invoice_amount": 1.0, "invoice_number": "OCR-1", "invoice_currency": "EUR"}'
+        )
+
+    stubs = {
+        "extract_invoice_fields_from_pdf": lambda path, domain: local,
+        "ocr_pdf": ocr_pdf,
+        "ocr_cache": types.SimpleNamespace(
+            get=lambda *args: None, put=lambda *args: None
+        ),
+    }
+    originals = {name: getattr(server, name) for name in stubs}
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as pdf:
+        pdf.write(b"%PDF-1.4\n%%EOF\n")
+        pdf.flush()
+        try:
+            for name, stub in stubs.items():
+                setattr(server, name, stub)
+            content = asyncio.run(server.extract_invoice_content(pdf.name))
+        finally:
+            for name, original in originals.items():
+                setattr(server, name, original)
+    return content.model_dump(), bool(ocr_calls)
+
+
+def test_vendor_extraction_skips_ocr():
+    content, used_ocr = extract_with(extract_invoice_fields(STRIPE_INVOICE, "fly.io"))
+    assert not used_ocr
+    assert content["invoice_amount"] == 119.0
+
+
+def test_generic_extraction_falls_back_to_ocr():
+    content, used_ocr = extract_with(extract_invoice_fields(GENERIC_SUBTOTAL_INVOICE))
+    assert used_ocr
+    assert content["invoice_number"] == "OCR-1"
+
+
+def test_incomplete_extraction_falls_back_to_ocr():
+    content, used_ocr = extract_with(
+        extract_invoice_fields("Invoice number 4F2A9C1B-0007\nTotal $119.00", "fly.io")
+    )
+    assert used_ocr
+
+
+if __name__ == "__main__":
+    tests = [
+        (name, test)
+        for name, test in list(globals().items())
+        if name.startswith("test_") and callable(test)
+    ]
+    failed = 0
+    for name, test in tests:
+        try:
+            test()
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {name}: {e!r}")
+        else:
+            print(f"✅ {name}")
+    print(f"\n{len(tests) - failed}/{len(tests)} tests passed")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,112 @@
+"""
+Tests for the daily rollup refresh in src/rollup.py. They need the Postgres
+database in DATABASE_URL and are skipped without it; their rows are dated
+1900-01-01 and removed again afterwards.
+
+    python -m pytest tests/   or   python tests/test_rollup.py
+"""
+
+import datetime
+import os
+import sys
+import threading
+import time
+import unittest
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from models import DatabaseManager, Transaction, daily_rollup  # noqa: E402
+from rollup import refresh_daily_rollup  # noqa: E402
+from sqlalchemy import delete, func, select  # noqa: E402
+
+TEST_DAY = datetime.date(1900, 1, 1)
+
+
+def database() -> DatabaseManager:
+    url = os.getenv("DATABASE_URL", "")
+    if not url.startswith("postgresql"):
+        raise unittest.SkipTest("DATABASE_URL is not set to a Postgres database")
+    db = DatabaseManager(url)
+    daily_rollup.create(db.engine, checkfirst=True)
+    return db
+
+
+def clean_up(db: DatabaseManager) -> None:
+    with db.get_session() as session:
+        session.execute(delete(Transaction).where(Transaction.date == TEST_DAY))
+        session.execute(delete(daily_rollup).where(daily_rollup.c.date == TEST_DAY))
+        session.commit()
+
+
+def rollup_rows(db: DatabaseManager) -> int:
+    with db.get_session() as session:
+        return session.scalar(
+            select(func.count())
+            .select_from(daily_rollup)
+            .where(daily_rollup.c.date == TEST_DAY)
+        )
+
+
+def test_concurrent_refreshes_of_a_day_do_not_duplicate_rows():
+    db = database()
+    clean_up(db)
+    try:
+        with db.get_session() as session:
+            for i, category in enumerate(["Software", "Software", "Travel"]):
+                session.add(
+                    Transaction(
+                        transaction_id=f"test-rollup-{i}",
+                        date=TEST_DAY,
+                        amount=Decimal("-10.00"),
+                        category=category,
+                        currency="EUR",
+                        is_invalid=False,
+                    )
+                )
+            session.commit()
+            refresh_daily_rollup(session, [TEST_DAY])
+            session.commit()
+        assert rollup_rows(db) == 2
+
+        # The first refresh stays open while the second one runs, as two
+        # update_transactions calls or a tool call and the pipeline would
+        def refresh(hold: float) -> None:
+            with db.get_session() as session:
+                refresh_daily_rollup(session, [TEST_DAY])
+                time.sleep(hold)
+                session.commit()
+
+        first = threading.Thread(target=refresh, args=(0.5,))
+        second = threading.Thread(target=refresh, args=(0,))
+        first.start()
+        time.sleep(0.1)
+        second.start()
+        first.join()
+        second.join()
+        assert rollup_rows(db) == 2
+    finally:
+        clean_up(db)
+        db.engine.dispose()
+
+
+if __name__ == "__main__":
+    tests = [
+        (name, test)
+        for name, test in list(globals().items())
+        if name.startswith("test_") and callable(test)
+    ]
+    failed = 0
+    for name, test in tests:
+        try:
+            test()
+        except unittest.SkipTest as e:
+            print(f"⏭️  {name}: {e}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {name}: {e!r}")
+        else:
+            print(f"✅ {name}")
+    print(f"\n{len(tests) - failed}/{len(tests)} tests passed")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,128 @@
+"""
+Migration: composite, partial and trigram indexes for the hot transaction queries
+Safe to run repeatedly; indexes are built CONCURRENTLY so the table stays writable
+"""
+
+import os
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+# The partial indexes use "is_invalid IS NOT TRUE", the exact predicate of the
+# MCP tools (NULL counts as valid); Postgres only uses a partial index when the
+# query's WHERE clause implies the index predicate.
+INDEXES = [
+    # Newest-first listing and exports: ORDER BY date DESC, transaction_id LIMIT n,
+    # plus date ranges (invoice matching)
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_transactions_date_desc_id
+        ON ivy_data.transactions (date DESC, transaction_id);
+    """,
+    # Filtered listings of valid transactions: category and provider equality,
+    # date range, newest first
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_transactions_valid_category_provider_date
+        ON ivy_data.transactions (category, provider, date DESC, transaction_id)
+        WHERE is_invalid IS NOT TRUE;
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_transactions_valid_provider_date
+        ON ivy_data.transactions (provider, date DESC, transaction_id)
+        WHERE is_invalid IS NOT TRUE;
+    """,
+    # Full-text search document; must match transaction_search_document in
+    # invoices-mcp/src/models.py
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_transactions_search_tsv ON ivy_data.transactions
+        USING GIN (to_tsvector('simple'::regconfig, coalesce(description, '') || ' ' || coalesce(counterparty, '')));
+    """,
+]
+
+TRIGRAM_INDEXES = [
+    # Fuzzy counterparty search (search_transactions)
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_transactions_counterparty_trgm
+        ON ivy_data.transactions USING GIN (counterparty gin_trgm_ops);
+    """,
+    # Substring search (ILIKE '%...%') on descriptions and references
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_transactions_description_trgm
+        ON ivy_data.transactions USING GIN (description gin_trgm_ops);
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_transactions_reference_trgm
+        ON ivy_data.transactions USING GIN (reference gin_trgm_ops);
+    """,
+]
+
+
+def add_query_indexes(database_url=DATABASE_URL):
+    """Creates the indexes and refreshes planner statistics"""
+
+    if not database_url:
+        print("❌ Please set DATABASE_URL in the .env file")
+        return False
+
+    try:
+        print("🔄 Connecting to PostgreSQL...")
+        conn = psycopg2.connect(database_url)
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+        conn.autocommit = True
+        cursor = conn.cursor()
+
+        statements = list(INDEXES)
+
+        # Tables created by the dlt pipeline have no primary key, which would
+        # leave lookups by ID (get_transactions_by_ids, update_transactions)
+        # scanning the whole table
+        cursor.execute("""
+            SELECT 1 FROM pg_index
+            WHERE indrelid = 'ivy_data.transactions'::regclass AND indisprimary;
+        """)
+        if cursor.fetchone() is None:
+            statements.append("""
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_transactions_transaction_id
+        ON ivy_data.transactions (transaction_id);
+    """)
+        try:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+            statements += TRIGRAM_INDEXES
+        except psycopg2.Error as e:
+            print(f"⚠️ pg_trgm is not available, skipping trigram indexes: {e}")
+
+        for i, statement in enumerate(statements, 1):
+            print(f"📊 Creating index {i}/{len(statements)}...")
+            cursor.execute(statement)
+
+        cursor.execute("ANALYZE ivy_data.transactions;")
+
+        # A failed concurrent build leaves an invalid index behind, which
+        # IF NOT EXISTS would then skip: it has to be dropped and rebuilt
+        cursor.execute("""
+            SELECT c.relname, i.indisvalid
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE i.indrelid = 'ivy_data.transactions'::regclass
+            ORDER BY c.relname;
+        """)
+        indexes = cursor.fetchall()
+        print(f"📋 Indexes on ivy_data.transactions: {[name for name, _ in indexes]}")
+        invalid = [name for name, valid in indexes if not valid]
+        if invalid:
+            print(f"⚠️ Invalid indexes, drop them and run again: {invalid}")
+
+        cursor.close()
+        conn.close()
+
+        print("✅ Indexes created successfully!")
+        return True
+
+    except Exception as e:
+        print(f"❌ Error creating indexes: {e}")
+        return False
+
+if __name__ == "__main__":
+    add_query_indexes()
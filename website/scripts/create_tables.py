@@ -2,9 +2,15 @@
 Script to create necessary tables in Supabase
 """
 
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 import psycopg2
 from psycopg2 import sql
 
+from src.daily_rollup import CREATE_DAILY_ROLLUP_SQL, refresh_daily_rollup
+
 def create_tables():
     """Creates necessary tables for the pipeline"""
     
@@ -30,8 +36,12 @@ def create_tables():
             month_year VARCHAR(7),
             is_stripe_invoice BOOLEAN DEFAULT FALSE,
             is_invalid BOOLEAN DEFAULT FALSE,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            invoice_number VARCHAR(50),
+            invoice_file_path TEXT
         );
+        ALTER TABLE ivy_data.transactions ADD COLUMN IF NOT EXISTS invoice_number VARCHAR(50);
+        ALTER TABLE ivy_data.transactions ADD COLUMN IF NOT EXISTS invoice_file_path TEXT;
         """,
         """
         CREATE TABLE IF NOT EXISTS ivy_data.stripe_invoices (
@@ -59,12 +69,31 @@ def create_tables():
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
         """,
+        CREATE_DAILY_ROLLUP_SQL,
         """
         CREATE INDEX IF NOT EXISTS idx_transactions_date ON ivy_data.transactions(date);
         CREATE INDEX IF NOT EXISTS idx_transactions_category ON ivy_data.transactions(category);
         CREATE INDEX IF NOT EXISTS idx_transactions_amount ON ivy_data.transactions(amount);
         CREATE INDEX IF NOT EXISTS idx_transactions_type ON ivy_data.transactions(transaction_type);
         CREATE INDEX IF NOT EXISTS idx_stripe_date ON ivy_data.stripe_invoices(date);
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_transactions_date_desc_id ON ivy_data.transactions(date DESC, transaction_id);
+        CREATE INDEX IF NOT EXISTS idx_transactions_valid_category_provider_date ON ivy_data.transactions(category, provider, date DESC, transaction_id)
+            WHERE is_invalid IS NOT TRUE;
+        CREATE INDEX IF NOT EXISTS idx_transactions_valid_provider_date ON ivy_data.transactions(provider, date DESC, transaction_id)
+            WHERE is_invalid IS NOT TRUE;
+        """,
+        """
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE INDEX IF NOT EXISTS idx_transactions_search_tsv ON ivy_data.transactions
+            USING GIN (to_tsvector('simple'::regconfig, coalesce(description, '') || ' ' || coalesce(counterparty, '')));
+        CREATE INDEX IF NOT EXISTS idx_transactions_counterparty_trgm ON ivy_data.transactions
+            USING GIN (counterparty gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS idx_transactions_description_trgm ON ivy_data.transactions
+            USING GIN (description gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS idx_transactions_reference_trgm ON ivy_data.transactions
+            USING GIN (reference gin_trgm_ops);
         """
     ]
     
@@ -82,6 +111,11 @@ def create_tables():
         
         print("✅ All tables created successfully!")
         
+        # Summaries read the rollup, so fill it from the transactions already loaded
+        rows = refresh_daily_rollup(cursor)
+        conn.commit()
+        print(f"📊 Daily rollup rebuilt: {rows} rows")
+        
         # Check created tables
         cursor.execute("""
             SELECT table_name 
@@ -0,0 +1,78 @@
+"""
+Daily rollup of transactions for the summary tools
+One row per day and category/provider/currency/type combination, so summaries
+scale with the number of days instead of the number of transactions
+Income and expenses are split by the sign of the amount, as the summaries
+always did, in the positive_* and negative_* columns
+"""
+
+CREATE_DAILY_ROLLUP_SQL = """
+CREATE TABLE IF NOT EXISTS ivy_data.daily_rollup (
+    date DATE NOT NULL,
+    category VARCHAR(100),
+    provider VARCHAR(100),
+    currency VARCHAR(3),
+    transaction_type VARCHAR(10),
+    is_stripe_invoice BOOLEAN,
+    is_invalid BOOLEAN,
+    amount_sum NUMERIC,
+    transaction_count BIGINT NOT NULL,
+    amount_min NUMERIC,
+    amount_max NUMERIC,
+    positive_amount_sum NUMERIC NOT NULL DEFAULT 0,
+    positive_count BIGINT NOT NULL DEFAULT 0,
+    negative_amount_sum NUMERIC NOT NULL DEFAULT 0,
+    negative_count BIGINT NOT NULL DEFAULT 0
+);
+ALTER TABLE ivy_data.daily_rollup ADD COLUMN IF NOT EXISTS positive_amount_sum NUMERIC NOT NULL DEFAULT 0;
+ALTER TABLE ivy_data.daily_rollup ADD COLUMN IF NOT EXISTS positive_count BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE ivy_data.daily_rollup ADD COLUMN IF NOT EXISTS negative_amount_sum NUMERIC NOT NULL DEFAULT 0;
+ALTER TABLE ivy_data.daily_rollup ADD COLUMN IF NOT EXISTS negative_count BIGINT NOT NULL DEFAULT 0;
+CREATE INDEX IF NOT EXISTS idx_daily_rollup_date ON ivy_data.daily_rollup(date);
+"""
+
+# Taken by every writer of the rollup, here and in invoices-mcp/src/rollup.py,
+# so two refreshes of a day never both delete and then both insert its rows.
+# Summaries can still read the table meanwhile
+LOCK_DAILY_ROLLUP_SQL = "LOCK TABLE ivy_data.daily_rollup IN SHARE ROW EXCLUSIVE MODE"
+
+# Delete and re-aggregate in one statement, so readers never see a day missing.
+# %(all)s refreshes every day; otherwise only the days in %(dates)s. Days are
+# bucketed by date(date), as in invoices-mcp/src/rollup.py
+REFRESH_DAILY_ROLLUP_SQL = """
+WITH cleared AS (
+    DELETE FROM ivy_data.daily_rollup
+    WHERE %(all)s OR date = ANY(%(dates)s::date[])
+)
+INSERT INTO ivy_data.daily_rollup (
+    date, category, provider, currency, transaction_type,
+    is_stripe_invoice, is_invalid,
+    amount_sum, transaction_count, amount_min, amount_max,
+    positive_amount_sum, positive_count, negative_amount_sum, negative_count
+)
+SELECT
+    date(date), category, provider, currency, transaction_type,
+    is_stripe_invoice, is_invalid,
+    SUM(amount), COUNT(*), MIN(amount), MAX(amount),
+    SUM(CASE WHEN amount > 0 THEN amount ELSE 0 END),
+    COUNT(CASE WHEN amount > 0 THEN 1 END),
+    SUM(CASE WHEN amount < 0 THEN amount ELSE 0 END),
+    COUNT(CASE WHEN amount < 0 THEN 1 END)
+FROM ivy_data.transactions
+WHERE date IS NOT NULL
+  AND (%(all)s OR date(date) = ANY(%(dates)s::date[]))
+GROUP BY date(date), category, provider, currency, transaction_type,
+    is_stripe_invoice, is_invalid
+"""
+
+
+def refresh_daily_rollup(cursor, dates=None):
+    """Recomputes the rollup rows of the given days (all days if None) from ivy_data.transactions
+    The lock is held until the caller commits"""
+    cursor.execute(CREATE_DAILY_ROLLUP_SQL)
+    cursor.execute(LOCK_DAILY_ROLLUP_SQL)
+    cursor.execute(
+        REFRESH_DAILY_ROLLUP_SQL,
+        {"all": dates is None, "dates": sorted(set(dates or []))},
+    )
+    return cursor.rowcount
@@ -7,9 +7,14 @@ import dlt
 import pandas as pd
 from typing import Iterator, Dict, Any
 import os
+import sys
 from datetime import datetime
 import re
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.daily_rollup import refresh_daily_rollup
+
 # Pipeline configuration
 @dlt.source
 def ivy_transactions_source():
@@ -142,10 +147,18 @@ def run_pipeline():
     print(f"Pipeline executed successfully!")
     print(f"Loads: {load_info}")
     
+    # Transactions are loaded with "replace", so every day may have changed:
+    # rebuild the rollup the summary tools read from
+    with pipeline.sql_client() as client:
+        with client.native_connection.cursor() as cursor:
+            rows = refresh_daily_rollup(cursor)
+        client.native_connection.commit()
+    print(f"Daily rollup refreshed: {rows} rows")
+    
     return pipeline
 
 def run_analytics_queries(pipeline):
-    """Runs analytical queries for dashboard insights"""
+    """Runs analytical queries for dashboard insights (aggregates come from daily_rollup)"""
     
     with pipeline.sql_client() as client:
         
@@ -154,11 +167,11 @@ def run_analytics_queries(pipeline):
             SELECT 
                 EXTRACT(YEAR FROM date) as year,
                 EXTRACT(MONTH FROM date) as month,
-                SUM(CASE WHEN amount > 0 THEN amount ELSE 0 END) as total_income,
-                SUM(CASE WHEN amount < 0 THEN ABS(amount) ELSE 0 END) as total_expenses,
-                SUM(amount) as net_amount,
-                COUNT(*) as transaction_count
-            FROM ivy_data.transactions
+                SUM(positive_amount_sum) as total_income,
+                -SUM(negative_amount_sum) as total_expenses,
+                SUM(amount_sum) as net_amount,
+                SUM(transaction_count) as transaction_count
+            FROM ivy_data.daily_rollup
             GROUP BY EXTRACT(YEAR FROM date), EXTRACT(MONTH FROM date)
             ORDER BY year DESC, month DESC
         """)
@@ -171,11 +184,11 @@ def run_analytics_queries(pipeline):
         category_expenses = client.execute_sql("""
             SELECT 
                 category,
-                SUM(ABS(amount)) as total_spent,
-                COUNT(*) as transaction_count,
-                AVG(ABS(amount)) as avg_transaction
-            FROM ivy_data.transactions
-            WHERE amount < 0
+                -SUM(negative_amount_sum) as total_spent,
+                SUM(negative_count) as transaction_count,
+                -SUM(negative_amount_sum) / SUM(negative_count) as avg_transaction
+            FROM ivy_data.daily_rollup
+            WHERE negative_count > 0
             GROUP BY category
             ORDER BY total_spent DESC
             LIMIT 10
@@ -206,10 +219,9 @@ def run_analytics_queries(pipeline):
         # 4. Invalid transactions
         invalid_transactions = client.execute_sql("""
             SELECT 
-                COUNT(*) as total_invalid,
-                COUNT(*) * 100.0 / (SELECT COUNT(*) FROM ivy_data.transactions) as invalid_percentage
-            FROM ivy_data.transactions
-            WHERE is_invalid = true
+                SUM(CASE WHEN is_invalid = true THEN transaction_count ELSE 0 END) as total_invalid,
+                SUM(CASE WHEN is_invalid = true THEN transaction_count ELSE 0 END) * 100.0 / SUM(transaction_count) as invalid_percentage
+            FROM ivy_data.daily_rollup
         """)
         
         print("\\n=== INVALID TRANSACTIONS ===")
@@ -219,12 +231,12 @@ def run_analytics_queries(pipeline):
         # 5. Monthly trends
         trends = client.execute_sql("""
             SELECT 
-                month_year,
-                COUNT(*) as transactions,
-                SUM(CASE WHEN amount > 0 THEN amount ELSE 0 END) as income,
-                SUM(CASE WHEN amount < 0 THEN ABS(amount) ELSE 0 END) as expenses
-            FROM ivy_data.transactions
-            GROUP BY month_year
+                TO_CHAR(date, 'YYYY-MM') as month_year,
+                SUM(transaction_count) as transactions,
+                SUM(positive_amount_sum) as income,
+                -SUM(negative_amount_sum) as expenses
+            FROM ivy_data.daily_rollup
+            GROUP BY TO_CHAR(date, 'YYYY-MM')
             ORDER BY month_year DESC
             LIMIT 6
         """)
@@ -243,6 +255,6 @@ if __name__ == "__main__":
     print("\\nPipeline and analytics completed!")
     print("\\nNext steps for dashboard:")
     print("1. Connect BI tool (Grafana, PowerBI, etc.) to PostgreSQL")
-    print("2. Use tables: transactions, stripe_invoices, category_summary")
+    print("2. Use tables: transactions, stripe_invoices, daily_rollup")
     print("3. Implement alerts for invalid transactions")
     print("4. Create KPI metrics based on analytical queries")
\ No newline at end of file
@@ -28,8 +28,11 @@ class TransactionQueryTool(BaseTool):
     name: str = "transaction_query"
     description: str = """Query financial transaction data directly with SQL. 
     Use this to answer specific questions about expenses, revenue, categories, dates, etc.
-    Available tables: ivy_data.transactions, ivy_data.stripe_invoices
-    Common columns: transaction_id, date, amount, description, category, counterparty, transaction_type, is_stripe_invoice"""
+    Available tables: ivy_data.transactions, ivy_data.stripe_invoices, ivy_data.daily_rollup
+    Common columns: transaction_id, date, amount, description, category, counterparty, transaction_type, is_stripe_invoice
+    ivy_data.daily_rollup has one row per date, category, provider, currency, transaction_type, is_stripe_invoice and is_invalid
+    with amount_sum, transaction_count, amount_min and amount_max, and income (amount > 0) and expenses (amount < 0)
+    in positive_amount_sum/positive_count and negative_amount_sum/negative_count; prefer it for totals and trends"""
     args_schema: Type[BaseModel] = TransactionQueryInput
     
     def _run(self, query: str) -> str:
@@ -63,16 +66,16 @@ class FinancialSummaryTool(BaseTool):
         try:
             engine = create_engine(DATABASE_URL)
             
-            # Overall summary
+            # Overall summary, from the per-day rollup
             summary_query = """
             SELECT 
-                SUM(CASE WHEN amount > 0 THEN amount ELSE 0 END) as total_income,
-                SUM(CASE WHEN amount < 0 THEN ABS(amount) ELSE 0 END) as total_expenses,
-                SUM(amount) as net_result,
-                COUNT(*) as total_transactions,
-                COUNT(CASE WHEN is_stripe_invoice = true THEN 1 END) as stripe_invoices,
-                COUNT(CASE WHEN is_invalid = true THEN 1 END) as invalid_transactions
-            FROM ivy_data.transactions
+                COALESCE(SUM(positive_amount_sum), 0) as total_income,
+                COALESCE(-SUM(negative_amount_sum), 0) as total_expenses,
+                COALESCE(SUM(amount_sum), 0) as net_result,
+                COALESCE(SUM(transaction_count), 0) as total_transactions,
+                COALESCE(SUM(CASE WHEN is_stripe_invoice = true THEN transaction_count END), 0) as stripe_invoices,
+                COALESCE(SUM(CASE WHEN is_invalid = true THEN transaction_count END), 0) as invalid_transactions
+            FROM ivy_data.daily_rollup
             """
             
             df = pd.read_sql(summary_query, engine)
@@ -118,29 +121,33 @@ class TopCategoriesTools(BaseTool):
         try:
             engine = create_engine(DATABASE_URL)
             
+            # Expenses are the negative amounts, income the positive ones
             if transaction_type == "expense":
-                where_clause = "WHERE amount < 0"
-                amount_calc = "SUM(ABS(amount))"
+                where_clause = "WHERE negative_count > 0"
+                amount_calc = "-SUM(negative_amount_sum)"
+                count_calc = "SUM(negative_count)"
                 title = "TOP EXPENSE CATEGORIES"
             elif transaction_type == "income":
-                where_clause = "WHERE amount > 0"
-                amount_calc = "SUM(amount)"
+                where_clause = "WHERE positive_count > 0"
+                amount_calc = "SUM(positive_amount_sum)"
+                count_calc = "SUM(positive_count)"
                 title = "TOP INCOME CATEGORIES"
             else:
                 where_clause = ""
-                amount_calc = "SUM(ABS(amount))"
+                amount_calc = "SUM(positive_amount_sum - negative_amount_sum)"
+                count_calc = "SUM(transaction_count)"
                 title = "TOP CATEGORIES (ALL)"
             
             query = f"""
             SELECT 
                 category,
                 {amount_calc} as total_amount,
-                COUNT(*) as transaction_count,
-                AVG(ABS(amount)) as avg_amount
-            FROM ivy_data.transactions
+                {count_calc} as transaction_count,
+                {amount_calc} / NULLIF({count_calc}, 0) as avg_amount
+            FROM ivy_data.daily_rollup
             {where_clause}
             GROUP BY category
-            ORDER BY {amount_calc} DESC
+            ORDER BY {amount_calc} DESC NULLS LAST
             LIMIT {limit}
             """
             
@@ -179,15 +186,16 @@ class StripeAnalysisTool(BaseTool):
         try:
             engine = create_engine(DATABASE_URL)
             
-            # Basic STRIPE summary
+            # Basic STRIPE summary, from the rollup rows of STRIPE transactions
             summary_query = """
             SELECT 
-                COUNT(*) as invoice_count,
-                SUM(amount) as total_revenue,
-                AVG(amount) as avg_invoice,
+                COALESCE(SUM(transaction_count), 0) as invoice_count,
+                SUM(amount_sum) as total_revenue,
+                SUM(amount_sum) / SUM(transaction_count) as avg_invoice,
                 MIN(date) as first_invoice,
                 MAX(date) as latest_invoice
-            FROM ivy_data.stripe_invoices
+            FROM ivy_data.daily_rollup
+            WHERE is_stripe_invoice = true
             """
             
             df = pd.read_sql(summary_query, engine)
@@ -218,9 +226,10 @@ Summary:
                 SELECT 
                     EXTRACT(YEAR FROM date) as year,
                     EXTRACT(MONTH FROM date) as month,
-                    COUNT(*) as invoices,
-                    SUM(amount) as monthly_revenue
-                FROM ivy_data.stripe_invoices
+                    SUM(transaction_count) as invoices,
+                    SUM(amount_sum) as monthly_revenue
+                FROM ivy_data.daily_rollup
+                WHERE is_stripe_invoice = true
                 GROUP BY EXTRACT(YEAR FROM date), EXTRACT(MONTH FROM date)
                 ORDER BY year, month
                 """
@@ -308,11 +317,11 @@ def chat_with_financial_data(question: str) -> str:
             
         elif any(word in q_lower for word in ['transactions', 'count', 'how many', 'number']):
             tool = TransactionQueryTool()
-            return tool._run("SELECT COUNT(*) as total_transactions, SUM(amount) as net_amount FROM ivy_data.transactions;")
+            return tool._run("SELECT SUM(transaction_count) as total_transactions, SUM(amount_sum) as net_amount FROM ivy_data.daily_rollup;")
             
         elif any(word in q_lower for word in ['invalid', 'problems', 'issues', 'quality']):
             tool = TransactionQueryTool()
-            return tool._run("SELECT COUNT(*) as invalid_count FROM ivy_data.transactions WHERE is_invalid = true;")
+            return tool._run("SELECT COALESCE(SUM(transaction_count), 0) as invalid_count FROM ivy_data.daily_rollup WHERE is_invalid = true;")
             
         elif any(word in q_lower for word in ['month', 'monthly', 'trend']):
             tool = TransactionQueryTool()
@@ -320,10 +329,10 @@ def chat_with_financial_data(question: str) -> str:
                 SELECT 
                     EXTRACT(YEAR FROM date) as year,
                     EXTRACT(MONTH FROM date) as month,
-                    SUM(CASE WHEN amount > 0 THEN amount ELSE 0 END) as income,
-                    SUM(CASE WHEN amount < 0 THEN ABS(amount) ELSE 0 END) as expenses,
-                    SUM(amount) as net
-                FROM ivy_data.transactions 
+                    SUM(positive_amount_sum) as income,
+                    -SUM(negative_amount_sum) as expenses,
+                    SUM(amount_sum) as net
+                FROM ivy_data.daily_rollup 
                 GROUP BY EXTRACT(YEAR FROM date), EXTRACT(MONTH FROM date)
                 ORDER BY year DESC, month DESC
                 LIMIT 6;
@@ -0,0 +1,196 @@
+"""
+Regression test for the query plans of the hot transaction queries
+Run against a database migrated with scripts/add_query_indexes.py to check
+that each query is served by the index meant for it; skipped without DATABASE_URL
+
+    python -m pytest tests/test_query_plans.py   or   python tests/test_query_plans.py
+"""
+
+import json
+import os
+import sys
+
+import psycopg2
+import pytest
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+# (name, query, parameters, indexes that may serve it, whether the index must
+# also provide the ORDER BY, i.e. the plan has no Sort node). Exports read every
+# matching row, so a bitmap scan followed by a sort is a good plan for them;
+# limited listings must be read in index order.
+HOT_QUERIES = [
+    (
+        "get_transactions: newest first",
+        """
+        SELECT * FROM ivy_data.transactions
+        ORDER BY date DESC, transaction_id
+        LIMIT 100
+        """,
+        {},
+        {"idx_transactions_date_desc_id"},
+        True,
+    ),
+    (
+        "valid transactions of a category and provider, newest first",
+        """
+        SELECT * FROM ivy_data.transactions
+        WHERE is_invalid IS NOT TRUE
+          AND category = %(category)s AND provider = %(provider)s
+          AND date >= %(start)s AND date <= %(end)s
+        ORDER BY date DESC, transaction_id
+        LIMIT 100
+        """,
+        {"category": "Software", "provider": "bank", "start": "2024-01-01", "end": "2024-12-31"},
+        {"idx_transactions_valid_category_provider_date"},
+        True,
+    ),
+    (
+        "export_transactions: category, provider and date range",
+        """
+        SELECT * FROM ivy_data.transactions
+        WHERE is_invalid IS NOT TRUE
+          AND category = %(category)s AND provider = %(provider)s
+          AND date >= %(start)s AND date <= %(end)s
+        ORDER BY date DESC, transaction_id
+        """,
+        {"category": "Software", "provider": "bank", "start": "2024-01-01", "end": "2024-12-31"},
+        {"idx_transactions_valid_category_provider_date"},
+        False,
+    ),
+    (
+        "export_transactions: provider and date range",
+        """
+        SELECT * FROM ivy_data.transactions
+        WHERE is_invalid IS NOT TRUE
+          AND provider = %(provider)s
+          AND date >= %(start)s AND date <= %(end)s
+        ORDER BY date DESC, transaction_id
+        """,
+        {"provider": "bank", "start": "2024-01-01", "end": "2024-12-31"},
+        {"idx_transactions_valid_provider_date"},
+        False,
+    ),
+    (
+        "match_invoices_to_transactions: date window",
+        """
+        SELECT transaction_id, date, amount, reference, counterparty, description
+        FROM ivy_data.transactions
+        WHERE is_invalid IS NOT TRUE AND amount IS NOT NULL
+          AND date BETWEEN %(start)s AND %(end)s
+        """,
+        {"start": "2024-03-01", "end": "2024-04-30"},
+        {"idx_transactions_date_desc_id", "idx_transactions_date"},
+        False,
+    ),
+    (
+        "get_transactions_by_ids",
+        """
+        SELECT * FROM ivy_data.transactions
+        WHERE transaction_id = ANY(%(ids)s)
+        """,
+        {"ids": ["t1", "t2", "t3"]},
+        {"transactions_pkey", "idx_transactions_transaction_id"},
+        False,
+    ),
+    (
+        "search_transactions: words",
+        """
+        SELECT * FROM ivy_data.transactions
+        WHERE to_tsvector('simple'::regconfig, coalesce(description, '') || ' ' || coalesce(counterparty, ''))
+            @@ websearch_to_tsquery('simple'::regconfig, %(term)s)
+        """,
+        {"term": "hosting"},
+        {"idx_transactions_search_tsv"},
+        False,
+    ),
+]
+
+TRIGRAM_QUERIES = [
+    (
+        "search_transactions: fuzzy counterparty",
+        "SELECT * FROM ivy_data.transactions WHERE counterparty %% %(term)s",
+        {"term": "fly.io"},
+        {"idx_transactions_counterparty_trgm"},
+        False,
+    ),
+    (
+        "description substring",
+        "SELECT * FROM ivy_data.transactions WHERE description ILIKE %(pattern)s",
+        {"pattern": "%hosting%"},
+        {"idx_transactions_description_trgm"},
+        False,
+    ),
+]
+
+
+def plan_nodes(plan):
+    """All nodes of an EXPLAIN (FORMAT JSON) plan tree"""
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def check_plan(cursor, name, query, params, indexes, ordered):
+    # A few matching rows are cheaper to fetch through a bitmap and then
+    # sort; rule that out where the index must provide the order
+    cursor.execute("SET LOCAL enable_bitmapscan = %s", ("off" if ordered else "on",))
+    cursor.execute("EXPLAIN (FORMAT JSON) " + query, params)
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    nodes = list(plan_nodes(plan[0]["Plan"]))
+    plan_text = json.dumps(plan, indent=2)
+
+    used = {node["Index Name"] for node in nodes if "Index Name" in node}
+    assert used & indexes, (
+        f"{name}: expected one of {sorted(indexes)}, plan uses {sorted(used) or 'no index'}\n{plan_text}"
+    )
+    assert not (ordered and any(node["Node Type"] in ("Sort", "Incremental Sort") for node in nodes)), (
+        f"{name}: index does not provide the order, plan sorts\n{plan_text}"
+    )
+
+    print(f"✅ {name}: {', '.join(sorted(used & indexes))}")
+
+
+def test_query_plans():
+    """Checks that every hot query is planned on its index"""
+
+    if not DATABASE_URL:
+        pytest.skip("DATABASE_URL is not set")
+
+    conn = psycopg2.connect(DATABASE_URL)
+    cursor = conn.cursor()
+    try:
+        # Small development tables are cheaper to scan than to index; rule out
+        # sequential scans so the test checks that an index *can* serve each
+        # query, independent of the table size. SET LOCAL ends with the rollback.
+        cursor.execute("SET LOCAL enable_seqscan = off")
+
+        queries = list(HOT_QUERIES)
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        if cursor.fetchone():
+            queries += TRIGRAM_QUERIES
+        else:
+            print("⚠️ pg_trgm is not installed, skipping trigram queries")
+
+        for query in queries:
+            check_plan(cursor, *query)
+    finally:
+        conn.rollback()
+        conn.close()
+
+    print(f"\n{len(queries)}/{len(queries)} query plans use their index")
+
+if __name__ == "__main__":
+    try:
+        test_query_plans()
+    except pytest.skip.Exception:
+        print("ERROR: Please set DATABASE_URL in the .env file")
+        sys.exit(1)
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)